@@ -0,0 +1,174 @@
+"""
+Times the core AddressBook operations on synthetic books and writes the
+results as JSON, so runs of different versions can be compared.
+
+For every book size and operation it reports latency percentiles over
+several runs and the peak memory allocated by one run (tracemalloc).
+
+Run from the repository root:
+    python -m benchmarks.core --output results.json
+    python -m benchmarks.core --sizes 1000,100000 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import bot
+from benchmarks.synthetic import TAGS, make_book
+
+# Inputs for guess_command: exact names, typos, prefixes and unknown words
+COMMAND_INPUTS = ['add Ann 0501234567', 'search ann', 'serch ann', 'ad x y',
+                  'birthdays 7', 'birthdys', 'edit-phne a b c', 'all 20',
+                  'tag-search work', 'xyzzy', 'helo', 'remove-tag a b']
+
+
+def consume(output):
+    """Reads streamed command output to the end, like printing it would."""
+    if output is not None and not isinstance(output, str):
+        for _ in output:
+            pass
+
+
+def operations(book, rng, directory):
+    """Returns (name, callable) pairs; each callable runs the operation once."""
+    names = rng.sample(list(book.data), min(len(book), 1000))
+    queries = [name[:rng.randint(3, 6)].lower() for name in names]
+    counter = iter(range(10 ** 9))
+    snapshot = os.path.join(directory, f'{len(book)}.pkl')
+    # The search indexes are built by the first search; do it before timing
+    consume(book.search(queries[0]))
+
+    def save():
+        journal, book.journal = book.journal, None
+        bot.save_data(book, snapshot)
+        book.journal = journal
+
+    def load():
+        bot.close_data(bot.load_data(snapshot))
+
+    return [
+        ('add_contact', lambda: bot.add_contact(
+            book, f'BenchContact{next(counter)}', str(rng.randrange(10 ** 9, 10 ** 10)))),
+        ('search_contacts', lambda: consume(bot.search_contacts(book, rng.choice(queries), 20))),
+        ('search_contacts_all', lambda: consume(bot.search_contacts(book, rng.choice(queries)))),
+        ('search_by_tag', lambda: consume(bot.search_by_tag(book, rng.choice(TAGS), 20))),
+        ('get_contacts_by_tags', lambda: book.get_contacts_by_tags(rng.sample(TAGS, 2))),
+        ('upcoming_birthday', lambda: bot.upcoming_birthday(book, rng.choice((7, 30)))),
+        ('sort_notes_by_tags', lambda: bot.sort_notes_by_tags(book)),
+        ('save_data', save),
+        ('load_data', load),
+        ('guess_command', lambda: bot.guess_command(rng.choice(COMMAND_INPUTS))),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(run, runs, max_seconds):
+    """Times `run` up to `runs` times (at least once, within max_seconds)."""
+    times = []
+    deadline = time.perf_counter() + max_seconds
+    while len(times) < runs and (not times or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'runs': len(times),
+        'mean_ms': statistics.fmean(times),
+        'min_ms': times[0],
+        'p50_ms': percentile(times, 0.50),
+        'p95_ms': percentile(times, 0.95),
+        'p99_ms': percentile(times, 0.99),
+        'max_ms': times[-1],
+        'peak_kib': peak / 1024,
+    }
+
+
+def max_rss_kib():
+    """Peak resident memory of this process, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform == 'darwin' else rss  # bytes on macOS
+
+
+def compare(results, baseline):
+    """Prints the p50 ratio of every operation against a previous run, to stderr."""
+    old = {(r['contacts'], r['operation']): r for r in baseline['results']}
+    print(f"{'contacts':>10} {'operation':<22} {'old p50':>10} {'new p50':>10} {'ratio':>7}",
+          file=sys.stderr)
+    for result in results:
+        before = old.get((result['contacts'], result['operation']))
+        if before is None:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        print(f"{result['contacts']:>10} {result['operation']:<22} "
+              f"{before['p50_ms']:>10.3f} {result['p50_ms']:>10.3f} {ratio:>6.2f}x",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000',
+                        help='comma-separated numbers of contacts')
+    parser.add_argument('--runs', type=int, default=50, help='timed runs per operation')
+    parser.add_argument('--max-seconds', type=float, default=10,
+                        help='stop timing an operation after this long')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='print p50 ratios against an earlier JSON result')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (int(size) for size in args.sizes.split(',')):
+            started = time.perf_counter()
+            book = make_book(count)
+            print(f'{count} contacts built in {time.perf_counter() - started:.1f} s',
+                  file=sys.stderr)
+            for name, run in operations(book, random.Random(count), directory):
+                result = measure(run, args.runs, args.max_seconds)
+                results.append({'contacts': count, 'operation': name, **result})
+                print(f"{count:>10} {name:<22} p50 {result['p50_ms']:9.3f} ms  "
+                      f"p99 {result['p99_ms']:9.3f} ms  peak {result['peak_kib']:10.1f} KiB",
+                      file=sys.stderr)
+            del book
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'max_rss_kib': max_rss_kib(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Load generator for the server mode (`python bot.py --serve ADDRESS`).
+Opens many concurrent client connections, sends a mix of read and write
+commands and reports requests per second and latency percentiles.
+
+Run from the repository root against a running server:
+    python -m benchmarks.loadgen --address 127.0.0.1:8765
+or let it start a local server on a synthetic book:
+    python -m benchmarks.loadgen --spawn 100000 --clients 32 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from bot import save_data
+from benchmarks.synthetic import TAGS, make_book
+
+
+def make_request(rng, names, write_ratio, client, i):
+    """Returns one command line; about `write_ratio` of them change the book."""
+    if rng.random() < write_ratio:
+        return rng.choice([
+            f'add LoadClient{client}x{i} {rng.randrange(10 ** 9, 10 ** 10)}',
+            f'add-tag {rng.choice(names)} {rng.choice(TAGS)}',
+            f'add-note {rng.choice(names)} load-{i}',
+        ])
+    return rng.choice([
+        f'search {rng.choice(names)[:4].lower()} 20',
+        f'phone {rng.choice(names)}',
+        f'search-tag {rng.choice(TAGS)} 20',
+        'birthdays 7',
+    ])
+
+
+async def connect(address):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+
+async def client(address, rng, names, requests, write_ratio, number, latencies):
+    """Sends `requests` commands one after another on one connection."""
+    reader, writer = await connect(address)
+    for i in range(requests):
+        line = make_request(rng, names, write_ratio, number, i)
+        started = time.perf_counter()
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+        if not await reader.readline():
+            raise ConnectionError('the server closed the connection')
+        latencies.append(time.perf_counter() - started)
+    writer.write(b'exit\n')
+    await writer.drain()
+    writer.close()
+
+
+async def run(address, names, clients, requests, write_ratio, seed):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(address, random.Random(seed + number), names, requests, write_ratio,
+               number, latencies)
+        for number in range(clients)))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+async def wait_for_server(address, process, timeout=600):
+    """Waits until the spawned server accepts connections."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await connect(address)
+        except OSError:
+            if process.poll() is not None or time.perf_counter() > deadline:
+                raise RuntimeError('the server did not start')
+            await asyncio.sleep(0.2)
+        else:
+            writer.close()
+            return
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, round(fraction * len(sorted_values)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--address', default='127.0.0.1:8765',
+                        help='server HOST:PORT or Unix socket path')
+    parser.add_argument('--spawn', type=int, metavar='CONTACTS',
+                        help='start a local server on a synthetic book of this size')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent connections')
+    parser.add_argument('--requests', type=int, default=200, help='requests per client')
+    parser.add_argument('--write-ratio', type=float, default=0.1,
+                        help='share of requests that change the book')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    process = None
+    directory = tempfile.TemporaryDirectory()
+    try:
+        if args.spawn:
+            book = make_book(args.spawn)
+            names = list(book.data)
+            filename = os.path.join(directory.name, 'load.pkl')
+            save_data(book, filename)
+            del book
+            process = subprocess.Popen([sys.executable, '-m', 'bot', '--serve', args.address,
+                                        '--data', filename])
+            asyncio.run(wait_for_server(args.address, process))
+        else:
+            names = [f'LoadContact{i}' for i in range(100)]
+        elapsed, latencies = asyncio.run(run(args.address, names, args.clients, args.requests,
+                                             args.write_ratio, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        directory.cleanup()
+
+    count = len(latencies)
+    print(f'{count} requests from {args.clients} clients in {elapsed:.2f} s: '
+          f'{count / elapsed:.0f} requests/s')
+    print('latency ms: ' + '  '.join(
+        f'{label} {percentile(latencies, fraction) * 1000:.2f}'
+        for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Reports how many bytes a contact costs, for the records alone, for a
+full AddressBook with its indexes, and for the book once a search has
+built the trigram and note indexes.
+
+Run from the repository root:
+    python -m benchmarks.memory
+    python -m benchmarks.memory --sizes 100000
+"""
+import argparse
+import gc
+import tracemalloc
+
+from bot import AddressBook
+from benchmarks.synthetic import make_records
+
+
+def measure(count, with_book, searched=False):
+    """Returns the bytes allocated per contact for `count` contacts."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    if with_book:
+        kept = AddressBook()
+        for record in make_records(count):
+            kept.add_record(record)
+        if searched:
+            list(kept.search('con'))
+            kept.search_notes('meeting')
+    else:
+        kept = list(make_records(count))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000',
+                        help='comma-separated numbers of contacts')
+    parser.add_argument('--records-only', action='store_true',
+                        help='skip the measurement of the book with indexes')
+    args = parser.parse_args()
+
+    print(f"{'contacts':>10} {'record B/contact':>18} {'book B/contact':>16} "
+          f"{'searched B/contact':>20}")
+    for count in (int(size) for size in args.sizes.split(',')):
+        records = measure(count, with_book=False)
+        book = searched = '-'
+        if not args.records_only:
+            book = f'{measure(count, with_book=True):.0f}'
+            searched = f'{measure(count, with_book=True, searched=True):.0f}'
+        print(f'{count:>10} {records:>18.0f} {book:>16} {searched:>20}')
+
+
+if __name__ == '__main__':
+    main()
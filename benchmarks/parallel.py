@@ -0,0 +1,82 @@
+"""
+Compares the serial and the process-pool scans of search_contacts
+(queries shorter than a trigram) and search_notes across worker counts.
+Shard loading is timed separately from the queries that reuse the shards.
+
+Run from the repository root:
+    python -m benchmarks.parallel
+    python -m benchmarks.parallel --size 1000000 --workers 1,2,4,8
+"""
+import argparse
+import os
+import statistics
+import time
+
+import bot
+from benchmarks.synthetic import make_book
+
+QUERIES = {
+    'contacts': ['an', 'ol', '7', 'jo'],
+    'notes': ['meeting', 'call back', 'vip', 'budget plan'],
+}
+
+
+def serial(book, query, kind):
+    """Runs the scan the handlers use without a ParallelScan."""
+    if kind == 'notes':
+        return [record for record in book.iter_records()
+                if query in record.note.lower()
+                or query in ' '.join(record.get_tags()).lower()]
+    return list(book.search(query))
+
+
+def timed(run, repeat):
+    """Returns the median time of `repeat` runs in seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=300000, help='number of contacts')
+    parser.add_argument('--workers', default=','.join(
+        str(n) for n in (1, 2, 4, 8, 16) if n <= cores) or '1',
+                        help='comma-separated worker counts')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query')
+    args = parser.parse_args()
+
+    book = make_book(args.size)
+    print(f'{args.size} contacts, {cores} cores')
+    baseline = {kind: sum(timed(lambda: serial(book, query, kind), args.repeat)
+                          for query in queries)
+                for kind, queries in QUERIES.items()}
+    print(f"{'workers':>8} {'load s':>8} {'contacts ms':>12} {'speedup':>8} "
+          f"{'notes ms':>10} {'speedup':>8}")
+    print(f"{'serial':>8} {'-':>8} {baseline['contacts'] * 1000:>12.1f} {1:>7.2f}x "
+          f"{baseline['notes'] * 1000:>10.1f} {1:>7.2f}x")
+    for workers in (int(n) for n in args.workers.split(',')):
+        scan = bot.ParallelScan(workers, min_records=0)
+        try:
+            started = time.perf_counter()
+            list(scan.search(book, 'warm-up'))  # Loads the shards
+            load = time.perf_counter() - started
+            totals = {}
+            for kind, queries in QUERIES.items():
+                for query in queries:
+                    assert list(scan.search(book, query, kind)) == serial(book, query, kind)
+                totals[kind] = sum(timed(lambda: list(scan.search(book, query, kind)), args.repeat)
+                                   for query in queries)
+        finally:
+            scan.close()
+        print(f"{workers:>8} {load:>8.2f} {totals['contacts'] * 1000:>12.1f} "
+              f"{baseline['contacts'] / totals['contacts']:>7.2f}x "
+              f"{totals['notes'] * 1000:>10.1f} {baseline['notes'] / totals['notes']:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures time-to-prompt: how long `python bot.py` takes from launch until
+it asks for the first command, and which imports that time goes to
+(collected with `python -X importtime`). Exits with status 1 when the
+median is over the budget, so it can guard startup in CI.
+
+Run from the repository root:
+    python -m benchmarks.prompt
+    python -m benchmarks.prompt --runs 20 --budget-ms 150 --banner --module
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+PROMPT = b'Enter command:'
+
+
+def time_to_prompt(command):
+    """Starts the bot, returns (seconds until the prompt, stderr of the run)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    seen = b''
+    while PROMPT not in seen:
+        chunk = process.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError('the bot exited before showing the prompt')
+        seen += chunk
+    elapsed = time.perf_counter() - started
+    _, stderr = process.communicate(b'exit\n')
+    return elapsed, stderr.decode()
+
+
+def slowest_imports(report, count):
+    """Returns the `count` modules with the largest cumulative import time (us)."""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='launches to measure')
+    parser.add_argument('--budget-ms', type=float, default=150,
+                        help='maximum median time-to-prompt')
+    parser.add_argument('--banner', action='store_true',
+                        help='show the commands table, as a plain launch does')
+    parser.add_argument('--module', action='store_true',
+                        help='launch with `python -m bot`, which reuses cached bytecode')
+    parser.add_argument('--data', default='addressbook.pkl', help='address book file')
+    args = parser.parse_args()
+
+    entry = ['-m', 'bot'] if args.module else ['bot.py']
+    command = [sys.executable, *entry, '--data', args.data]
+    if not args.banner:
+        command.append('--no-banner')
+    times = [time_to_prompt(command)[0] * 1000 for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f'time-to-prompt: median {median:.1f} ms, min {min(times):.1f} ms, '
+          f'max {max(times):.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)')
+
+    _, report = time_to_prompt([sys.executable, '-X', 'importtime'] + command[1:])
+    print('slowest imports (cumulative ms):')
+    for cumulative, module in slowest_imports(report, 10):
+        print(f'{cumulative / 1000:>8.1f}  {module}')
+
+    if median > args.budget_ms:
+        print(f'over budget by {median - args.budget_ms:.1f} ms', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares snapshot compression settings: file size, write time and load
+time of a synthetic book for every codec and level, so the --compress
+default can be chosen for the disk at hand.
+
+Run from the repository root:
+    python -m benchmarks.snapshot
+    python -m benchmarks.snapshot --size 1000000 --levels none,zlib:1,zlib:6,lzma:0
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import bot
+from benchmarks.synthetic import make_book
+
+LEVELS = 'none,zlib:1,zlib:3,zlib:6,zlib:9,lzma:0,lzma:3,lzma:6'
+
+
+def timed(run, repeat):
+    """Returns the median time of `repeat` runs in seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000, help='number of contacts')
+    parser.add_argument('--levels', default=LEVELS, help='comma-separated CODEC[:LEVEL] values')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per setting')
+    args = parser.parse_args()
+
+    book = make_book(args.size)
+    print(f'{args.size} contacts')
+    print(f"{'setting':>8} {'size MiB':>9} {'ratio':>6} {'write s':>8} {'load s':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'book.pkl')
+        plain = None
+        for setting in args.levels.split(','):
+            compression = bot.parse_compression(setting)
+            write = timed(lambda: bot.write_snapshot(book, filename, compression), args.repeat)
+            load = timed(lambda: bot.read_snapshot(filename), args.repeat)
+            size = os.path.getsize(filename)
+            plain = plain or (size if compression[0] == 'none' else None)
+            ratio = f'{plain / size:.1f}x' if plain else '-'
+            print(f'{setting:>8} {size / 2 ** 20:>9.1f} {ratio:>6} {write:>8.2f} {load:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares startup time of the pickle and columnar (.abk) snapshots:
+the time to open the book and look up one contact in a fresh process.
+
+Run from the repository root:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --sizes 10000,100000 --runs 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from bot import convert_data, save_data
+from benchmarks.synthetic import make_book
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+from bot import close_data, load_data
+book = load_data(sys.argv[1])
+book.find_record(sys.argv[2])
+print(time.perf_counter() - start)
+close_data(book)
+'''
+
+
+def startup(filename, name, runs):
+    """Returns the best time in seconds over `runs` fresh processes."""
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE, filename, name],
+                                capture_output=True, text=True, check=True)
+        times.append(float(result.stdout))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='comma-separated numbers of contacts')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='processes started per measurement')
+    args = parser.parse_args()
+
+    print(f"{'contacts':>10} {'pkl ms':>10} {'abk ms':>10} {'pkl MB':>8} {'abk MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (int(size) for size in args.sizes.split(',')):
+            pkl = os.path.join(directory, f'{count}.pkl')
+            abk = os.path.join(directory, f'{count}.abk')
+            book = make_book(count)
+            name = next(iter(book))
+            save_data(book, pkl)
+            del book
+            convert_data(pkl, abk)
+            times = [startup(filename, name, args.runs) * 1000 for filename in (pkl, abk)]
+            sizes = [os.path.getsize(filename) / 2 ** 20 for filename in (pkl, abk)]
+            print(f'{count:>10} {times[0]:>10.1f} {times[1]:>10.1f} {sizes[0]:>8.1f} {sizes[1]:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
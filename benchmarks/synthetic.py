@@ -0,0 +1,54 @@
+"""
+Synthetic contacts for the benchmarks.
+The data is random but seeded, so runs are comparable across versions.
+"""
+import random
+
+from bot import AddressBook, Record
+
+FIRST_NAMES = ['Oleh', 'Anna', 'Ivan', 'Maria', 'Taras', 'Olena', 'Petro',
+               'Iryna', 'Andrii', 'Sofiia', 'John', 'Emma', 'Liam', 'Olivia']
+LAST_NAMES = ['Fedorchuk', 'Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko',
+              'Kravchenko', 'Smith', 'Johnson', 'Brown', 'Taylor']
+TAGS = ['work', 'family', 'friends', 'kyiv', 'lviv', 'odesa', 'client', 'vip',
+        'school', 'gym', 'archived', 'travel', 'music', 'sport', 'book-club',
+        'neighbours', 'doctor', 'team', 'partner', 'supplier']
+WORDS = ['meeting', 'call', 'back', 'project', 'birthday', 'gift', 'coffee',
+         'invoice', 'contract', 'review', 'next', 'week', 'monday', 'office',
+         'remote', 'lunch', 'deadline', 'budget', 'plan', 'trip']
+DOMAINS = ['example.com', 'gmail.com', 'ukr.net', 'company.ua', 'mail.com']
+
+
+def make_record(rng, i):
+    """Builds one contact; about half of the optional fields are filled in."""
+    name = f'{rng.choice(FIRST_NAMES)}{rng.choice(LAST_NAMES)}{i}'
+    record = Record(name)
+    for _ in range(rng.choice((1, 1, 1, 2, 3))):
+        record.add_phone(str(rng.randrange(10 ** 9, 10 ** 10)))
+    if rng.random() < 0.7:
+        record.add_birthday(
+            f'{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2010)}')
+    if rng.random() < 0.6:
+        record.set_email(f'{name.lower()}@{rng.choice(DOMAINS)}')
+    if rng.random() < 0.4:
+        record.add_note(' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))))
+    if rng.random() < 0.5:
+        for tag in rng.sample(TAGS, rng.randint(1, 3)):
+            record.add_tag(tag)
+    if rng.random() < 0.3:
+        record.set_address(f'{rng.randint(1, 200)} {rng.choice(LAST_NAMES)} street')
+    return record
+
+
+def make_records(count, seed=0):
+    """Yields `count` synthetic records."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield make_record(rng, i)
+
+
+def make_book(count, seed=0):
+    """Returns an AddressBook filled with `count` synthetic records."""
+    book = AddressBook()
+    book.add_records(make_records(count, seed))
+    return book
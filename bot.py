@@ -1,114 +1,54 @@
-from collections import UserDict
-from datetime import datetime
-import pickle
+from collections import Counter, UserDict, deque, namedtuple
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from itertools import islice, takewhile
+from datetime import date, datetime, timedelta
+import bisect
+import argparse
+import functools
+import os
 import re
-import difflib
+import struct
+import sys
+import time
+import weakref
 from colorama import init, Fore, Back, Style
 
-init(autoreset=True)
-
-# Function to display a table of available commands
+# Modules needed by only one backend or command (pickle, sqlite3, mmap, csv...)
+# are imported where they are used, so launching the bot does not pay for them.
 
 
-def display_commands_table():
-    # Define the list of commands grouped by categories
-    commands = [
-        ("Main commands", [
-            ("hello", "Greeting"),  # Greet the user
-            ("exit", "Exit the program"),  # Exit the program
-            ("close", "Close the program"),  # Close the program
-        ]),
-        ("Contact management", [
-            ("add", "Add contact"),  # Add a new contact
-            ("edit-name", "Edit a contact's name"),  # Edit a contact's name
-            ("delete", "Delete a contact"),  # Delete a contact
-            ("search", "Search for a contact"),  # Search for a contact
-            ("all", "Show all contacts"),  # Display all contacts
-        ]),
-        ("Phone management", [
-            ("phone", "Show a contact's phone"),  # Show a contact's phone
-            ("edit-phone", "Edit a phone"),  # Edit a contact's phone number
-            # Remove a contact's phone number
-            ("remove-phone", "Remove a phone"),
-        ]),
-        ("Address management", [
-            ("add-address", "Add address"),  # Add an address to a contact
-            ("edit-address", "Edit address"),  # Edit a contact's address
-            ("remove-address", "Remove address"),  # Remove a contact's address
-        ]),
-        ("Note management", [
-            ("add-note", "Add a note"),  # Add a note to a contact
-            ("edit-note", "Edit a note"),  # Edit a note
-            ("remove-note", "Remove a note"),  # Remove a note
-            ("show-note", "Show a note"),  # Display a note
-        ]),
-        ("Tag management", [
-            ("add-tag", "Add a tag to a note"),  # Add a tag to a note
-            ("remove-tag", "Remove a tag from a note"),  # Remove a tag from a note
-            ("show-tags", "Show all tags of a note"),  # Show all tags of a note
-            ("search-tag", "Search for contacts with a specific tag"),  # Search for contacts with a specific tag
-            ("all-tags", "Show all unique tags"),  # Show all unique tags
-        ]),
-        ("Birthday management", [
-            ("add-birthday", "Add a birthday"),  # Add a birthday to a contact
-            ("show-birthday", "Show a birthday"),  # Show a contact's birthday
-            ("birthdays", "Show upcoming birthdays"),  # Show upcoming birthdays
-        ]),
-        ("Email management", [
-            ("add-email", "Add email"),  # Add an email to a contact
-            ("edit-email", "Edit email"),  # Edit a contact's email
-            ("remove-email", "Remove email"),  # Remove a contact's email
-        ]),
-        ("Tags management", [
-            ("add-tag", "add-tag"),  # add a tag to a contact
-            ("remove-tag", "remove-tag"),  # remove a tag from a contact
-            ("show-tags", "show-tags"),  # show existing tags
-            ("search-tag", "search-tag"),  # find a contact by tag
-            ("sort-notes", "sort-notes")  # sorts notes by tags
-        ])
-    ]
+# Function to render the table of available commands. It is built once and
+# reused by the welcome banner and the commands command.
+@functools.cache
+def commands_table():
+    # Group the registered commands by category, keeping registry order
+    categories = {}
+    for command in COMMANDS:
+        categories.setdefault(command.category, []).append(command)
 
     # Helper function to format rows for display
     def format_row(cmd, desc):
         return f"{Fore.GREEN}{cmd:<15}{Fore.WHITE}{desc}{Style.RESET_ALL}"
 
-    # Print commands grouped by category
-    for category, cmds in commands:
-        print(Back.LIGHTCYAN_EX + Fore.WHITE +
-              f"{category}".center(50) + Style.RESET_ALL)
-        print(Fore.CYAN + "." * 50 + Style.RESET_ALL)
-        for cmd, desc in cmds:
-            print(format_row(cmd, desc))
-        print(Fore.CYAN + "." * 50 + Style.RESET_ALL)
-        print("\n")
-
-
-def guess_command(user_input, know_commands):
-    '''
-    Розширенний автопідбір: повертає список можливих команд, що містять введений текст
-    або схожі на нього
-    '''
-    tokens = user_input.strip().split()
-    if not tokens:
-        return None, []
-
-    input_cmd = tokens[0].lower()
-    args = tokens[1:]
-
-    if input_cmd in know_commands:
-        return input_cmd, args
-
-    contains_matches = [cmd for cmd in know_commands if input_cmd in cmd]
-
-    unclear_matches = difflib.get_close_matches(input_cmd, know_commands, n=len(know_commands),
-                                                cutoff=0.5)
-
-    all_matches = list(dict.fromkeys(contains_matches + unclear_matches))
+    # Commands grouped by category
+    lines = []
+    for category, cmds in categories.items():
+        lines.append(Back.LIGHTCYAN_EX + Fore.WHITE +
+                     f"{category}".center(50) + Style.RESET_ALL)
+        lines.append(Fore.CYAN + "." * 50 + Style.RESET_ALL)
+        for command in cmds:
+            lines.append(format_row(command.name, command.description))
+            for alias in command.aliases:
+                lines.append(format_row(alias, command.description))
+        lines.append(Fore.CYAN + "." * 50 + Style.RESET_ALL)
+        lines.append("\n")
+    return '\n'.join(lines)
 
-    if all_matches:
-        return all_matches, args
 
-    return None, args
+# Function to display a table of available commands
+def display_commands_table():
+    print(commands_table())
 
 
 # Function to validate phone numbers
@@ -151,41 +91,533 @@ def validate_birthday(value):
     return datetime(year, month, day).date()
 
 
+# Function to map a birthday to its day of year in a leap year (1-366),
+# so the key does not depend on the year the birthday falls in
+def birthday_key(value):
+    return date(2000, value.month, value.day).timetuple().tm_yday
+
+
+# Function to find the next date (today included) a birthday is celebrated.
+# Feb 29 birthdays are celebrated on Feb 28 in non-leap years.
+def next_birthday(birthday, today):
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = birthday.replace(year=year)
+        except ValueError:
+            candidate = date(year, 2, 28)
+        if candidate >= today:
+            return candidate
+
+
+# Function to turn "the next `days` days from `today`" into ranges of birthday
+# keys, in date order. Two ranges are returned when the window wraps past
+# the end of the year.
+def birthday_windows(days, today):
+    first_key = birthday_key(today)
+    if days >= 365:
+        # Every birthday comes around within a year
+        return [(first_key, 366), (1, first_key - 1)]
+    end = today + timedelta(days=days)
+    last_key = birthday_key(end)
+    if (end.month, end.day) == (2, 28) and (end + timedelta(days=1)).month == 3:
+        # Feb 29 birthdays are celebrated on Feb 28 in non-leap years
+        last_key += 1
+    if end.year == today.year:
+        return [(first_key, last_key)]
+    return [(first_key, 366), (1, last_key)]
+
+
+# Function to split text into the trigrams used by the search index
+def trigrams(text):
+    # Pad with a sentinel so texts shorter than 3 characters still get a gram
+    padded = f'\0{text}\0'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Words too common to help rank notes
+STOP_WORDS = frozenset('''
+a an and are as at be but by for from has have he her his i in is it its me my
+no not of on or our she so than that the their them then there these they this
+to too us was we were what when where which who will with you your
+'''.split())
+
+# Suffixes stem() removes, longest first
+STEM_SUFFIXES = ('ations', 'ation', 'ments', 'ment', 'ness', 'ings', 'ing',
+                 'edly', 'ed', 'ies', 'ly', 'es', 's')
+
+
+# Function to fold case and accents, so 'Café' and 'cafe' compare equal
+def fold_text(text):
+    if text.isascii():
+        return text.lower()  # No accents to strip
+    import unicodedata
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+# Function to normalize a contact name for case- and accent-insensitive lookups
+def name_key(name):
+    return fold_text(name.strip())
+
+
+# Function to reduce a word to a rough stem: 'meetings' and 'meeting' give 'meet'
+def stem(word):
+    if len(word) <= 3:
+        return word
+    for suffix in STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix == 'es' and not word[:-2].endswith(('s', 'x', 'z', 'ch', 'sh')):
+                suffix = 's'  # 'notes' -> 'note', but 'boxes' -> 'box'
+            word = word[:-len(suffix)] + ('y' if suffix == 'ies' else '')
+            break
+    if len(word) >= 4 and word[-1] == word[-2] and word[-1] not in 'aeioulsz':
+        word = word[:-1]  # 'planned' -> 'plann' -> 'plan'
+    if len(word) > 4 and word.endswith('e'):
+        word = word[:-1]  # 'invoice' and 'invoices' -> 'invoic'
+    return word
+
+
+# Function to split text into the normalized, stemmed words the note index stores
+def note_terms(text):
+    return [stem(word) for word in re.findall(r'\w+', fold_text(text))
+            if word not in STOP_WORDS]
+
+
+class NoteIndex:
+    """
+    Inverted index of the words in contact notes and tags.
+    Maps each term to {record name: term count}, so a query only
+    touches the records that contain its words. Results are ranked
+    with BM25.
+    """
+
+    K1 = 1.2  # How quickly repeating a word stops adding to the score
+    B = 0.75  # How much long notes are penalized
+
+    def __init__(self):
+        self.postings = {}  # term -> {record name: count}
+        self.lengths = {}  # record name -> number of terms
+        self.total = 0  # Sum of the lengths, for the average
+
+    @staticmethod
+    def record_terms(record):
+        return note_terms(' '.join([record.note, *record.get_tags()]))
+
+    def add(self, record):
+        terms = self.record_terms(record)
+        if not terms:
+            return
+        name = record.name.value
+        for term, count in Counter(terms).items():
+            self.postings.setdefault(term, {})[name] = count
+        self.lengths[name] = len(terms)
+        self.total += len(terms)
+
+    def remove(self, record):
+        name = record.name.value
+        length = self.lengths.pop(name, None)
+        if length is None:
+            return
+        self.total -= length
+        for term in set(self.record_terms(record)):
+            bucket = self.postings.get(term)
+            if bucket is not None:
+                bucket.pop(name, None)
+                if not bucket:
+                    del self.postings[term]
+
+    def rank(self, query, limit=None):
+        """
+        Returns the names of the records matching any word of the query,
+        best BM25 score first (ties by name), at most `limit` of them.
+        """
+        import heapq
+        import math
+        count = len(self.lengths)
+        if not count:
+            return []
+        average = self.total / count
+        scores = {}
+        for term in set(note_terms(query)):
+            bucket = self.postings.get(term)
+            if not bucket:
+                continue
+            idf = math.log(1 + (count - len(bucket) + 0.5) / (len(bucket) + 0.5))
+            for name, tf in bucket.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[name] / average)
+                scores[name] = scores.get(name, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        order = lambda item: (-item[1], item[0])
+        if limit is None:
+            best = sorted(scores.items(), key=order)
+        else:
+            best = heapq.nsmallest(limit, scores.items(), key=order)
+        return [name for name, _ in best]
+
+
+# Function to find the names within `distance` edits (Levenshtein, on folded
+# names) of query in a sorted list of (name_key, name) pairs. The keys are
+# walked like a trie: the distance rows of a shared prefix are reused, and
+# once a prefix is out of reach all keys starting with it are skipped with
+# one bisect. Only the 2 * distance + 1 cells near the diagonal are computed.
+def fuzzy_names(entries, query, distance):
+    target = name_key(query)
+    size = len(target)
+    far = distance + 1  # Any distance beyond reach
+    rows = [[min(j, far) for j in range(size + 1)]]  # rows[n]: distances of previous[:n]
+    previous = ''
+    found = []
+    i = 0
+    while i < len(entries):
+        key = entries[i][0]
+        common = 0
+        shared = min(len(key), len(previous))
+        while common < shared and key[common] == previous[common]:
+            common += 1
+        del rows[common + 1:]
+        for depth in range(common, len(key)):
+            row, char, n = rows[-1], key[depth], depth + 1
+            new = [far] * (size + 1)
+            if n <= distance:
+                new[0] = n
+            for j in range(max(1, n - distance), min(size, n + distance) + 1):
+                new[j] = min(row[j - 1] + (target[j - 1] != char),
+                             row[j] + 1, new[j - 1] + 1, far)
+            rows.append(new)
+            if min(new) == far:
+                break
+        previous = key[:len(rows) - 1]
+        if len(previous) < len(key):
+            i = bisect.bisect_left(entries, (previous + '\U0010ffff',), i + 1)
+            continue
+        if rows[-1][size] <= distance:
+            found.append((rows[-1][size], entries[i][1]))
+        i += 1
+    return sorted(found)
+
+
+# Function to set bit i of a bytearray bitmap, growing it as needed
+def set_bit(bits, i):
+    byte = i >> 3
+    if byte >= len(bits):
+        bits.extend(bytes(byte + 1 - len(bits)))
+    bits[byte] |= 1 << (i & 7)
+
+
+# Function to clear bit i of a bytearray bitmap
+def clear_bit(bits, i):
+    byte = i >> 3
+    if byte < len(bits):
+        bits[byte] &= ~(1 << (i & 7)) & 0xFF
+
+
+# Function to turn a sequence of ids into an int bitmap
+def bitmap_from_ids(ids):
+    bits = bytearray()
+    for i in ids:
+        set_bit(bits, i)
+    return int.from_bytes(bits, 'little')
+
+
+# Function to list the ids set in an int bitmap, in ascending order.
+# Zero bytes are skipped by a regex scan, so sparse results stay cheap.
+def ids_from_bitmap(bitmap):
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for match in re.finditer(rb'[^\x00]', data):
+        byte, base = match[0][0], match.start() * 8
+        for bit in range(8):
+            if byte >> bit & 1:
+                yield base + bit
+
+
+class TagQuery:
+    """
+    Boolean tag expression such as 'work AND (kyiv OR lviv) NOT archived'.
+    AND binds tighter than OR, NOT applies to the term after it and terms
+    written side by side are ANDed. Keywords are case-insensitive.
+    The expression is parsed once into a tree of tuples:
+    ('tag', name), ('not', node), ('and', [nodes]) and ('or', [nodes]).
+    """
+
+    KEYWORDS = ('AND', 'OR', 'NOT')
+
+    def __init__(self, text):
+        self.text = text
+        self._tokens = re.findall(r'[()]|[^\s()]+', text)
+        self._position = 0
+        if not self._tokens:
+            raise ValueError('Tag query is empty')
+        self.tree = self._parse_or()
+        if self._position < len(self._tokens):
+            raise ValueError(f'Unexpected "{self._tokens[self._position]}" in tag query')
+
+    @classmethod
+    def all_of(cls, tags):
+        """Returns the query matching records that have every one of the tags."""
+        query = cls.__new__(cls)
+        query.text = ' AND '.join(tags)
+        query.tree = ('and', [('tag', tag) for tag in tags])
+        return query
+
+    # ---- Parsing ----
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            token = self._tokens[self._position]
+            return token.upper() if token.upper() in self.KEYWORDS else token
+        return None
+
+    def _parse_or(self):
+        terms = [self._parse_and()]
+        while self._peek() == 'OR':
+            self._position += 1
+            terms.append(self._parse_and())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def _parse_and(self):
+        terms = [self._parse_term()]
+        while self._peek() not in (None, 'OR', ')'):
+            if self._peek() == 'AND':
+                self._position += 1
+            terms.append(self._parse_term())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def _parse_term(self):
+        token = self._peek()
+        if token is None or token in ('AND', 'OR', ')'):
+            raise ValueError(f'Tag query "{self.text}" is missing a tag')
+        self._position += 1
+        if token == 'NOT':
+            return ('not', self._parse_term())
+        if token == '(':
+            node = self._parse_or()
+            if self._peek() != ')':
+                raise ValueError(f'Tag query "{self.text}" is missing ")"')
+            self._position += 1
+            return node
+        return ('tag', token)
+
+    # ---- Evaluation ----
+
+    def tags(self, node=None):
+        """Returns the set of tags the query mentions."""
+        kind, value = node or self.tree
+        if kind == 'tag':
+            return {value}
+        if kind == 'not':
+            return self.tags(value)
+        return set().union(*(self.tags(child) for child in value))
+
+    def matches(self, tags, node=None):
+        """Checks the query against one record's tags."""
+        kind, value = node or self.tree
+        if kind == 'tag':
+            return value in tags
+        if kind == 'not':
+            return not self.matches(tags, value)
+        if kind == 'and':
+            return all(self.matches(tags, child) for child in value)
+        return any(self.matches(tags, child) for child in value)
+
+    def evaluate(self, bitmap, count, universe):
+        """
+        Evaluates the query on int bitmaps with one bit per record id.
+        bitmap(tag) returns the bitmap of a tag, count(tag) its number of
+        records and universe() the bitmap of all records. Operands of AND
+        are taken smallest first, and evaluation stops once nothing is left.
+        """
+        cache = {}  # tag -> bitmap, and None -> universe
+
+        def size(node):
+            kind, value = node
+            if kind == 'tag':
+                return count(value)
+            if kind == 'not':
+                return float('inf')
+            sizes = [size(child) for child in value]
+            return min(sizes) if kind == 'and' else sum(sizes)
+
+        def run(node):
+            kind, value = node
+            if kind == 'tag':
+                if value not in cache:
+                    cache[value] = bitmap(value)
+                return cache[value]
+            if kind == 'not':
+                if None not in cache:
+                    cache[None] = universe()
+                return cache[None] & ~run(value)
+            if kind == 'or':
+                result = 0
+                for child in value:
+                    result |= run(child)
+                return result
+            # NOT operands go last: removing bits from a small result is cheapest
+            result = None
+            for child in sorted(value, key=size):
+                if child[0] == 'not' and result is not None:
+                    result &= ~run(child[1])
+                else:
+                    result = run(child) if result is None else result & run(child)
+                if not result:
+                    return 0
+            return result
+        return run(self.tree)
+
+
+# Function to cut one page out of a stream of records and render it lazily.
+# `items` is an iterable, or a callable that takes the offset and returns an
+# iterator already starting there (so a database can skip rows itself).
+# Returns None for an empty page, so callers can report "not found" right away;
+# otherwise a generator that renders each item only when it is printed.
+def paginate(items, limit=None, offset=0, render=str):
+    limit = None if limit is None else int(limit)
+    offset = int(offset)
+    if offset < 0 or (limit is not None and limit < 1):
+        raise ValueError('Page size must be positive and offset not negative')
+    if callable(items):
+        source, skip = items(offset), 0
+    else:
+        source, skip = iter(items), offset
+    stop = None if limit is None else offset + limit
+    page = islice(source, skip, None if limit is None else skip + limit)
+    first = next(page, None)
+    if first is None:
+        return None
+
+    def rendered():
+        yield render(first)
+        for item in page:
+            yield render(item)
+        if stop is not None and next(source, None) is not None:
+            yield Fore.YELLOW + f'More results available, next offset: {stop}' + Style.RESET_ALL
+    return rendered()
+
+
+# Function to split the words of a command into a query and the page numbers
+# after it: search-notes budget meetings 5 10 -> ['budget meetings', '5', '10'].
+# Quotes around the query are dropped, since command words are not unquoted.
+def query_and_page(words):
+    words = list(words)
+    page = []
+    while len(words) > 1 and len(page) < 2 and words[-1].isdigit():
+        page.insert(0, words.pop())
+    return [' '.join(words).strip('"\''), *page]
+
+
+# Pattern of the colour codes colorama puts into messages
+ANSI_CODES = re.compile(r'\x1b\[[0-9;]*m')
+
+
+# Function to print a command result; streamed results are printed piece by piece
+def emit(output, file=None, colour=True):
+    chunks = [output] if output is None or isinstance(output, str) else output
+    for chunk in chunks:
+        if not colour and chunk is not None:
+            chunk = ANSI_CODES.sub('', chunk)
+        print(chunk, file=file)
+
+
+# Function to collect command output as plain text, e.g. to send it to a client
+def render(output):
+    chunks = [output] if output is None or isinstance(output, str) else output
+    return '\n'.join(ANSI_CODES.sub('', str(chunk)) for chunk in chunks)
+
+
+# Function to suggest contact names close to a name that was not found
+def did_you_mean(book, name):
+    suggest = getattr(book, 'suggest_names', None)
+    if suggest is None or not isinstance(name, str):
+        return ''
+    names = suggest(name)
+    if not names:
+        return ''
+    return '\n' + Fore.YELLOW + f'Did you mean: {", ".join(names)}?' + Style.RESET_ALL
+
+
+# Function to count the running command as failed in the stats, for handlers
+# that report an error themselves instead of raising it; returns the message
+def command_failed(message):
+    if STATS is not None:
+        STATS.failed = True
+    return message
+
+
 # Decorator to handle exceptions in functions
 def exception_handler(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except KeyError:
-            return 'Contact not found'
+            if STATS is not None:
+                STATS.failed = True
+            # Handlers take (book, name, ...): offer the names closest to the missing one
+            return 'Contact not found' + (did_you_mean(*args[:2]) if len(args) >= 2 else '')
         except Exception as e:
+            if STATS is not None:
+                STATS.failed = True
             return f"{e}"
     return wrapper
 
 
+# Decorator for Record methods that change the record, so the owning book
+# can keep its indexes and journal up to date and the cached text is redrawn
+def mutator(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        self._rendered = None
+        book = self._book
+        if book is None:
+            return func(self, *args, **kwargs)
+        book._before_change(self)
+        try:
+            result = func(self, *args, **kwargs)
+        except Exception:
+            book._after_change(self, changed=False)
+            raise
+        book._after_change(self)
+        return result
+    return wrapper
+
+
 # Base class for fields like Name, Phone, Birthday, etc.
+# Fields use __slots__ to keep per-contact memory low on big books.
 class Field:
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
     def __str__(self):
         return str(self.value)
 
+    def __getstate__(self):
+        return {'value': self.value}
+
+    def __setstate__(self, state):
+        # Files written before __slots__ hold the same plain dict
+        self.value = state['value']
+
 
 # Class for contact names
 class Name(Field):
+    __slots__ = ()
+
     def __init__(self, value):
-        super().__init__(value)
+        super().__init__(sys.intern(value))
 
 
 # Class for phone numbers
 class Phone(Field):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__(value)
 
 
 # Class for birthdays
 class Birthday(Field):
+    __slots__ = ()
+
     def __init__(self, value):
         # Validate and store the birthday date
         validated_date = validate_birthday(value)
@@ -197,47 +629,65 @@ class Birthday(Field):
 
 
 class Tag(Field):
+    __slots__ = ()
+
     def __init__(self, value):
-        super().__init__(value)
+        # The same tags repeat across many contacts, so share one string
+        super().__init__(sys.intern(value))
 
 
 class Record:
     """
     Represents a single contact record in the address book.
     Contains fields such as name, phones, birthday, email, notes, and address.
+    Phones and tags are kept in tuples and the record uses __slots__,
+    so an empty field costs a shared constant instead of a new container.
     """
 
+    _fields = ('name', 'phones', 'birthday', 'note', 'tags', 'email', 'address')
+    # _book is the address book the record belongs to; set by AddressBook.add_record.
+    # _rendered caches __str__ until a mutator changes the record.
+    # __weakref__ lets SQLiteAddressBook cache the records it has materialized.
+    __slots__ = _fields + ('_book', '_rendered', '__weakref__')
+
     def __init__(self, name, email=None, address=None):
+        self._book = None
+        self._rendered = None
         self.name = Name(name)
-        self.phones = []
+        self.phones = ()
         self.birthday = None
         self.note = ''
-        self.tags = set()
+        self.tags = ()
         self.email = Email(email) if email else None
-        self.tags = set()
         self.address = address
 
+    @mutator
     def set_address(self, address):
         """Sets the address for the contact."""
         self.address = address
 
+    @mutator
     def edit_address(self, new_address):
         """Edits the address of the contact."""
         self.address = new_address
 
+    @mutator
     def remove_address(self):
         """Removes the address from the contact."""
         self.address = None
 
+    @mutator
     def add_phone(self, phone):
         """Adds a phone number to the contact."""
         validated_phone = validate_phone(phone)
-        self.phones.append(Phone(validated_phone))
+        self.phones += (Phone(validated_phone),)
 
+    @mutator
     def add_birthday(self, birthday_str):
         """Adds a birthday to the contact."""
         self.birthday = Birthday(birthday_str)
 
+    @mutator
     def remove_phone(self, phone):
         """
         Removes a phone number from the contact.
@@ -245,16 +695,18 @@ class Record:
         """
         for i, k in enumerate(self.phones):
             if k.value == phone:
-                del self.phones[i]
+                self.phones = self.phones[:i] + self.phones[i + 1:]
                 return
         raise ValueError(f"Phone number {phone} not found.")
 
+    @mutator
     def edit_phone(self, old_phone, new_phone):
         """Edits an existing phone number."""
         for i, k in enumerate(self.phones):
             if k.value == old_phone:
                 validated_phone = validate_phone(new_phone)
-                self.phones[i] = Phone(validated_phone)
+                self.phones = self.phones[:i] + \
+                    (Phone(validated_phone),) + self.phones[i + 1:]
                 return
         raise ValueError('Phone not found')
 
@@ -262,32 +714,39 @@ class Record:
         """Finds a phone number in the contact."""
         return next((k for k in self.phones if k.value == phone), None)
 
+    @mutator
     def set_email(self, email_str: str):
         """Sets an email address for the contact."""
         self.email = Email(email_str)
 
+    @mutator
     def edit_email(self, new_email_str: str):
         """Edits the email address of the contact."""
         self.email = Email(new_email_str)
 
+    @mutator
     def remove_email(self):
         """Removes the email address from the contact."""
         if self.email is None:
             raise ValueError('Email is alredy removed or not set')
         self.email = None
 
+    @mutator
     def edit_name(self, new_name):
         """Edits the name of the contact."""
         self.name = Name(new_name)
 
+    @mutator
     def add_note(self, note):
         """Adds a note to the contact."""
         self.note = note
 
+    @mutator
     def edit_note(self, note):
         """Edits the note of the contact."""
         self.note = note
 
+    @mutator
     def remove_note(self):
         """Removes the note from the contact."""
         self.note = ''
@@ -296,13 +755,16 @@ class Record:
         """Returns the note of the contact."""
         return self.note
 
+    @mutator
     def add_tag(self, tag):
         """Adds a tag to the note"""
-        self.tags.add(Tag(tag))
+        if not self.has_tag(tag):
+            self.tags += (Tag(tag),)
 
+    @mutator
     def remove_tag(self, tag):
         """Removes a tag from the note"""
-        self.tags = {t for t in self.tags if t.value != tag}
+        self.tags = tuple(t for t in self.tags if t.value != tag)
 
     def get_tags(self):
         """Returns a list of note tags"""
@@ -312,11 +774,47 @@ class Record:
         """Checks if the note has a specific tag"""
         return any(t.value == tag for t in self.tags)
 
+    def search_fields(self):
+        """Returns the lowercased name, phones, email and note matched by search."""
+        fields = [self.name.value.lower()]
+        fields.extend(str(phone.value).lower() for phone in self.phones)
+        if self.email:
+            fields.append(self.email.value.lower())
+        if self.note:
+            fields.append(self.note.lower())
+        return fields
+
+    def __getstate__(self):
+        """Pickles the record without the back-reference to its book."""
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __setstate__(self, state):
+        """
+        Restores the record, also from files written before __slots__
+        where phones were a list and tags a set.
+        """
+        self._book = None
+        self._rendered = None
+        self.name = state['name']
+        self.phones = tuple(state.get('phones', ()))
+        self.birthday = state.get('birthday')
+        self.note = state.get('note', '')
+        self.tags = tuple({t.value: t for t in state.get('tags', ())}.values())
+        self.email = state.get('email')
+        self.address = state.get('address')
+
     def __str__(self):
         """
         Returns a string representation of the contact,
         including name, phones, birthday, email, notes, tags, and address.
+        The text is built once and reused until the record changes.
         """
+        if self._rendered is None:
+            self._rendered = self._render()
+        return self._rendered
+
+    def _render(self):
+        """Builds the text returned by __str__."""
         phone_str = ', '.join(str(k)
                               for k in self.phones) if self.phones else '📵 No phones'
         bday_str = f'🎂 Birthday:{Style.RESET_ALL}{self.birthday}' if self.birthday else '🎂 Birthday: Not set'
@@ -344,9 +842,18 @@ class Email:
     Validates the email format before storing it.
     """
 
+    __slots__ = ('_value',)
+
     def __init__(self, email: str):
         self.value = email  # Initialize the email value
 
+    def __getstate__(self):
+        return {'_value': self._value}
+
+    def __setstate__(self, state):
+        # Files written before __slots__ hold the same plain dict
+        self._value = state['_value']
+
     @property
     def value(self):
         """Getter for the email value."""
@@ -370,78 +877,526 @@ class Email:
         return re.match(pattern, email) is not None
 
 
+# Function to normalize an email address for lookups: addresses differ only by case
+def email_key(email):
+    return email.strip().lower()
+
+
+# Function to turn the domain of an address (or a bare domain) around:
+# 'ann@mail.example.com' -> 'com.example.mail', so a domain and its
+# subdomains sort next to each other
+def reversed_domain(email):
+    domain = email_key(email).rpartition('@')[2].strip('.')
+    return '.'.join(reversed(domain.split('.')))
+
+
+# Choices for duplicate phones and emails: accept them, accept them with a
+# warning, or refuse them
+DUPLICATE_POLICIES = ('allow', 'flag', 'reject')
+
+
 class AddressBook(UserDict):
     """
     Represents the address book, which is a collection of contact records.
     Inherits from UserDict to provide dictionary-like behavior.
     """
 
+    # What to do when a phone that belongs to another contact is added:
+    # one of DUPLICATE_POLICIES, set per book with --duplicate-phones
+    duplicate_phones = 'flag'
+    # The same choice for an email address that another contact already has
+    duplicate_emails = 'flag'
+    # Changes remembered for changes_since(); caches further behind rebuild
+    RECENT_CHANGES = 10000
+
+    def __init__(self, *args, **kwargs):
+        self.journal = None
+        self.version = 0  # Counts changes, so caches can tell when they are stale
+        self._recent = deque(maxlen=self.RECENT_CHANGES)  # (version, op, record name)
+        self._tag_index = {}  # tag -> {record name: record}
+        self._ids = {}  # record name -> dense id, the bit of the record in the bitmaps
+        self._id_names = []  # id -> record name, or None when the id is free
+        self._free_ids = []  # ids of deleted records, reused first
+        self._live = bytearray()  # bitmap of the ids in use
+        self._tag_bits = {}  # tag -> bytearray bitmap of ids
+        # trigram of searchable text -> {record names}; built by the first search()
+        self._gram_index = None
+        self._birthdays = []  # sorted (birthday_key, record name) pairs
+        self._phone_index = {}  # phone -> tuple of owner names
+        self._email_index = {}  # email_key -> tuple of owner names
+        self._names = []  # sorted (name_key, record name) pairs
+        self._changing = {}  # id of a record being changed -> its sorted entries before
+        self._domains = []  # sorted (reversed_domain, record name) pairs
+        self._note_index = None  # words of notes and tags; built by the first search_notes()
+        super().__init__(*args, **kwargs)
+
+    def __getstate__(self):
+        """Only the records are pickled; the journal is reattached by load_data."""
+        return {'data': self.data}
+
+    def __setstate__(self, state):
+        """Restores the book, also from files written before records were tracked."""
+        self.__init__()
+        self.add_records(state['data'].values())
+
+    def _index(self, record, pending=None, sorted_lists=True):
+        """
+        Adds the record to the book's indexes.
+        Bulk callers pass a `pending` dict to collect the entries of the
+        sorted indexes and merge them in once (see add_records).
+        With sorted_lists=False the sorted indexes are left alone.
+        """
+        name = record.name.value
+        if sorted_lists:
+            for index, entry in self._sorted_entries(record):
+                self._insort(index, entry, pending)
+        record_id = self._ids.get(name)
+        if record_id is None:
+            record_id = self._assign_id(name)
+        set_bit(self._live, record_id)
+        for tag in record.get_tags():
+            self._tag_index.setdefault(tag, {})[name] = record
+            set_bit(self._tag_bits.setdefault(tag, bytearray()), record_id)
+        if self._gram_index is not None:
+            for gram in self._record_grams(record):
+                self._gram_index.setdefault(gram, set()).add(name)
+        for phone in record.phones:
+            owners = self._phone_index.get(phone.value, ())
+            if name not in owners:
+                self._phone_index[phone.value] = owners + (name,)
+        if record.email:
+            key = email_key(record.email.value)
+            owners = self._email_index.get(key, ())
+            if name not in owners:
+                self._email_index[key] = owners + (name,)
+        if self._note_index is not None:
+            self._note_index.add(record)
+
+    def _assign_id(self, name):
+        """Gives the record name a dense id, reusing the id of a deleted record."""
+        if self._free_ids:
+            record_id = self._free_ids.pop()
+            self._id_names[record_id] = name
+        else:
+            record_id = len(self._id_names)
+            self._id_names.append(name)
+        self._ids[name] = record_id
+        return record_id
+
+    def _release_id(self, name):
+        """Frees the id of a deleted record (its bits are already cleared)."""
+        record_id = self._ids.pop(name)
+        self._id_names[record_id] = None
+        self._free_ids.append(record_id)
+
+    def _insort(self, index, entry, pending):
+        """Inserts entry into the sorted list named `index`, or adds it to pending."""
+        if pending is None:
+            bisect.insort(getattr(self, index), entry)
+        else:
+            pending.setdefault(index, []).append(entry)
+
+    @staticmethod
+    def _discard(index, entry):
+        """Removes entry from the sorted list `index` if it is there."""
+        i = bisect.bisect_left(index, entry)
+        if i < len(index) and index[i] == entry:
+            del index[i]
+
+    def _unindex(self, record, sorted_lists=True):
+        """Removes the record from the book's indexes; sorted_lists=False keeps the sorted ones."""
+        name = record.name.value
+        if sorted_lists:
+            for index, entry in self._sorted_entries(record):
+                self._discard(getattr(self, index), entry)
+        record_id = self._ids[name]
+        clear_bit(self._live, record_id)
+        for tag in record.get_tags():
+            bucket = self._tag_index.get(tag)
+            if bucket is not None:
+                bucket.pop(name, None)
+                clear_bit(self._tag_bits[tag], record_id)
+                if not bucket:
+                    del self._tag_index[tag]
+                    del self._tag_bits[tag]
+        if self._gram_index is not None:
+            for gram in self._record_grams(record):
+                names = self._gram_index.get(gram)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self._gram_index[gram]
+        for phone in record.phones:
+            owners = tuple(owner for owner in self._phone_index.get(phone.value, ())
+                           if owner != name)
+            if owners:
+                self._phone_index[phone.value] = owners
+            else:
+                self._phone_index.pop(phone.value, None)
+        if record.email:
+            key = email_key(record.email.value)
+            owners = tuple(owner for owner in self._email_index.get(key, ()) if owner != name)
+            if owners:
+                self._email_index[key] = owners
+            else:
+                self._email_index.pop(key, None)
+        if self._note_index is not None:
+            self._note_index.remove(record)
+
+    @staticmethod
+    def _sorted_entries(record):
+        """Returns (sorted index name, entry) for each sorted index the record is in."""
+        name = record.name.value
+        entries = [('_names', (name_key(name), name))]
+        if record.birthday:
+            entries.append(('_birthdays', (birthday_key(record.birthday.value), name)))
+        if record.email:
+            entries.append(('_domains', (reversed_domain(record.email.value), name)))
+        return entries
+
+    @staticmethod
+    def _record_grams(record):
+        """Collects the trigrams of every searchable field of the record."""
+        grams = set()
+        for field in record.search_fields():
+            grams |= trigrams(field)
+        return grams
+
+    # The trigram and note indexes are the slowest to build and the largest,
+    # so loading a book skips them; the first search builds them, and from
+    # then on _index/_unindex keep them up to date like the others.
+
+    def _grams(self):
+        """Returns the trigram index, building it on first use."""
+        if self._gram_index is None:
+            index = {}
+            for name, record in self.data.items():
+                for gram in self._record_grams(record):
+                    index.setdefault(gram, set()).add(name)
+            self._gram_index = index
+        return self._gram_index
+
+    def _notes(self):
+        """Returns the note index, building it on first use."""
+        if self._note_index is None:
+            index = NoteIndex()
+            for record in self.data.values():
+                index.add(record)
+            self._note_index = index
+        return self._note_index
+
+    def _before_change(self, record):
+        """Called by Record mutators before the record changes."""
+        # Inserting into and deleting from a sorted list shifts it, so the
+        # sorted indexes are only touched if the name, birthday or email change
+        self._changing[id(record)] = self._sorted_entries(record)
+        self._unindex(record, sorted_lists=False)
+
+    def _after_change(self, record, changed=True):
+        """Called by Record mutators after the record changed (or failed to)."""
+        before = self._changing.pop(id(record))
+        moved = self._sorted_entries(record) != before
+        if moved:
+            for index, entry in before:
+                self._discard(getattr(self, index), entry)
+        self._index(record, sorted_lists=moved)
+        if changed:
+            self._journal('put', record)
+
+    def _journal(self, op, arg):
+        """
+        Counts a change and appends it to the journal,
+        compacting the journal when it grows too long.
+        """
+        self.version += 1
+        self._recent.append((self.version, op, arg.name.value if op == 'put' else arg))
+        journal = self.journal
+        if journal is None:
+            return
+        journal.append(op, arg)
+        # Compact only once the log outgrows the book, so each change stays amortized O(1)
+        if journal.entries >= max(journal.compact_every, len(self.data)):
+            save_data(self, journal.snapshot)
+
+    def changes_since(self, version):
+        """
+        Returns {record name: deleted} for the contacts changed after
+        `version`, where deleted tells whether the contact was deleted in
+        between (if it is back, it has moved to the end of the book).
+        Returns None when the recent changes do not reach back that far.
+        """
+        if version == self.version:
+            return {}
+        if not self._recent or self._recent[0][0] > version + 1:
+            return None
+        changed = {}
+        for change_version, op, name in reversed(self._recent):
+            if change_version <= version:
+                break
+            changed[name] = changed.get(name, False) or op == 'del'
+        return changed
+
     def add_record(self, record):
         """Adds a new contact record to the address book."""
-        self.data[record.name.value] = record
+        name = record.name.value
+        if self.data.get(name) is record:
+            return
+        old = self.data.get(name)
+        if old is not None:
+            self._unindex(old)
+            old._book = None
+        self.data[name] = record
+        record._book = self
+        self._index(record)
+        self._journal('put', record)
+
+    def add_records(self, records):
+        """
+        Adds many records at once, replacing contacts with the same name.
+        The sorted indexes (names, birthdays, domains) are merged and
+        re-sorted once for the whole batch. Returns the number of records added.
+        """
+        pending = {}
+        added = set()  # names indexed by this call, whose sorted entries are in pending
+        count = 0
+        for record in records:
+            name = record.name.value
+            old = self.data.get(name)
+            if old is record:
+                continue
+            if old is not None:
+                self._unindex(old)
+                old._book = None
+                if name in added:
+                    # A second row with the same name: drop the first row's pending entries
+                    for entries in pending.values():
+                        entries[:] = [entry for entry in entries if entry[1] != name]
+            added.add(name)
+            self.data[name] = record
+            record._book = self
+            self._index(record, pending)
+            self._journal('put', record)
+            count += 1
+        for index, entries in pending.items():
+            index = getattr(self, index)
+            index.extend(entries)
+            index.sort()
+        return count
+
+    def _find_exact(self, name):
+        """Finds a contact record by its exact name."""
+        return self.data.get(name)
 
     def find_record(self, name):
-        """Finds a contact record by name."""
-        return self.data.get(name)
+        """
+        Finds a contact record by name. Without an exact match, a name that
+        differs only in case or accents is found too, unless several do.
+        """
+        record = self._find_exact(name)
+        if record is None:
+            key = name_key(name)
+            # Names equal to the key sort before longer names with the same prefix
+            found = [match for match in self.complete(name, 2) if name_key(match) == key]
+            if len(found) == 1:
+                record = self._find_exact(found[0])
+        return record
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to `limit` contact names starting with prefix, ignoring
+        case and accents, in name_key order: one bisect on the name index.
+        """
+        key = name_key(prefix)
+        lo = bisect.bisect_left(self._names, (key,))
+        return [name for found, name in self._names[lo:lo + limit] if found.startswith(key)]
+
+    def suggest_names(self, name, distance=None, limit=5):
+        """
+        Returns up to `limit` contact names within `distance` typos (edit
+        distance on folded names) of name, closest first. By default one
+        typo is allowed in names up to 3 letters and two in longer ones.
+        Searches the sorted name index, so nothing extra is kept up to date.
+        """
+        if distance is None:
+            distance = 1 if len(name_key(name)) <= 3 else 2
+        return [match for _, match in fuzzy_names(self._names, name, distance)[:limit]]
+
+    def iter_records(self, offset=0):
+        """
+        Iterates over the records from `offset` on.
+        Only the references are copied (8 bytes a contact), so the iterator
+        stays valid even if the book changes while it is being read.
+        """
+        return islice(list(self.data.values()), offset, None)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups many changes: the journal is paused and one snapshot
+        is written at the end instead.
+        """
+        journal, self.journal = self.journal, None
+        try:
+            yield self
+        finally:
+            self.journal = journal
+            if journal is not None:
+                save_data(self, journal.snapshot)
 
     def delete_record(self, name):
         """Deletes a contact record by name."""
         if name in self.data:
-            del self.data[name]
+            record = self.data.pop(name)
+            self._unindex(record)
+            self._release_id(name)
+            record._book = None
+            self._journal('del', name)
+
+    def search(self, query):
+        """
+        Yields records whose name, phone, email or note contains the query.
+        Candidates come from the trigram index and are verified lazily,
+        so a caller reading the first page does not pay for the rest.
+        Results are ordered by name.
+        """
+        query = query.lower()
+        if not query:
+            yield from (self.data[name] for name in sorted(self.data))
+            return
+        grams = self._grams()
+        if len(query) >= 3:
+            postings = sorted((grams.get(query[i:i + 3], set())
+                               for i in range(len(query) - 2)), key=len)
+            candidates = set(postings[0])
+            for names in postings[1:]:
+                if not candidates:
+                    break
+                candidates &= names
+        else:
+            # Too short for a full trigram: take every gram that contains it
+            candidates = set()
+            for gram, names in grams.items():
+                if query in gram:
+                    candidates |= names
+        for name in sorted(candidates):
+            record = self.data[name]
+            if any(query in field for field in record.search_fields()):
+                yield record
+
+    def find_by_phone(self, phone):
+        """Returns the records that own the phone number."""
+        return [self.data[name] for name in self._phone_index.get(phone, ())]
+
+    def check_phone(self, phone, name):
+        """
+        Checks whether the phone already belongs to a contact other than `name`.
+        Depending on duplicate_phones, raises ValueError ('reject'),
+        returns a warning ('flag') or ignores it ('allow').
+        """
+        owners = [record.name.value for record in self.find_by_phone(phone)
+                  if record.name.value != name]
+        if not owners or self.duplicate_phones == 'allow':
+            return None
+        message = f'Phone {phone} already belongs to {", ".join(owners)}'
+        if self.duplicate_phones == 'reject':
+            raise ValueError(message)
+        return message
+
+    def find_by_email(self, email):
+        """Returns the records with the email address, ignoring case."""
+        return [self.data[name] for name in self._email_index.get(email_key(email), ())]
+
+    def search_by_domain(self, domain):
+        """
+        Returns the records with an email address at the domain or one of
+        its subdomains ('example.com' also finds '@mail.example.com'), by name.
+        """
+        key = reversed_domain(domain)
+        # The domain itself, then its subdomains: every key starting with key + '.'
+        entries = self._domains_between(key, key + '\0') + \
+            self._domains_between(key + '.', key + '/')
+        return [self.data[name] for name in sorted(name for _, name in entries)]
+
+    def _domains_between(self, first, stop):
+        """Returns the domain index entries with reversed domains in [first, stop)."""
+        lo = bisect.bisect_left(self._domains, (first,))
+        hi = bisect.bisect_left(self._domains, (stop,))
+        return self._domains[lo:hi]
+
+    def check_email(self, email, name):
+        """
+        Checks whether the email already belongs to a contact other than `name`.
+        Depending on duplicate_emails, raises ValueError ('reject'),
+        returns a warning ('flag') or ignores it ('allow').
+        """
+        owners = [record.name.value for record in self.find_by_email(email)
+                  if record.name.value != name]
+        if not owners or self.duplicate_emails == 'allow':
+            return None
+        message = f'Email {email} already belongs to {", ".join(owners)}'
+        if self.duplicate_emails == 'reject':
+            raise ValueError(message)
+        return message
+
+    def search_notes(self, query, limit=None):
+        """Returns the records whose notes or tags best match the words of the query."""
+        return [self.data[name] for name in self._notes().rank(query, limit)]
 
     def search_by_tag(self, tag):
         """Поиск контактов по тегу"""
-        results = []
-        for record in self.data.values():
-            if record.has_tag(tag):
-                results.append(record)
-        return results
+        return list(self._tag_index.get(tag, {}).values())
 
     def get_all_tags(self):
         """Получение всех уникальных тегов"""
-        all_tags = set()
-        for record in self.data.values():
-            all_tags.update(record.get_tags())
-        return sorted(all_tags)
+        return sorted(self._tag_index)
 
     def get_contacts_by_tags(self, tags):
         """Получение контактов, имеющих все указанные теги"""
-        results = []
-        for record in self.data.values():
-            if all(record.has_tag(tag) for tag in tags):
-                results.append(record)
-        return results
+        if not tags:
+            return list(self.data.values())
+        return self.search_by_tags(TagQuery.all_of(tags))
 
-    def upcoming_birthday(self, days=7):
+    def search_by_tags(self, query):
+        """
+        Returns the records matching a tag query (a TagQuery or its text,
+        e.g. 'work AND (kyiv OR lviv) NOT archived'), by name.
+        Evaluated with bitwise operations on the per-tag bitmaps.
+        """
+        if isinstance(query, str):
+            query = TagQuery(query)
+        bits = query.evaluate(
+            lambda tag: int.from_bytes(self._tag_bits.get(tag, b''), 'little'),
+            lambda tag: len(self._tag_index.get(tag, ())),
+            lambda: int.from_bytes(self._live, 'little'))
+        names = sorted(self._id_names[record_id] for record_id in ids_from_bitmap(bits))
+        return [self.data[name] for name in names]
+
+    def _birthdays_between(self, first_key, last_key):
+        """Returns the birthday index entries with keys in [first_key, last_key]."""
+        lo = bisect.bisect_left(self._birthdays, (first_key,))
+        hi = bisect.bisect_left(self._birthdays, (last_key + 1,))
+        return self._birthdays[lo:hi]
+
+    def upcoming_birthday(self, days=7, today=None):
         """
         Finds contacts with upcoming birthdays within the specified number of days.
-        Returns a list of records with upcoming birthdays.
-        """
-        list_bday = []
-        today = datetime.now().date()
-        for record in self.data.values():
-            if record.birthday:
-                # Calculate the birthday for the current year
-                bday_this_year = record.birthday.value.replace(year=today.year)
-                if bday_this_year < today:
-                    # If the birthday has already passed this year, calculate for the next year
-                    bday_this_year = record.birthday.value.replace(
-                        year=today.year + 1)
-                # Check if the birthday is within the specified range
-                if 0 <= (bday_this_year - today).days <= days:
-                    list_bday.append(record)
-
-        return list_bday
+        Returns a list of records ordered by the upcoming date.
+        """
+        today = today or datetime.now().date()
+        return [self.data[name]
+                for first_key, last_key in birthday_windows(days, today)
+                for _, name in self._birthdays_between(first_key, last_key)]
 
     def rename_record(self, old_name, new_name):
         """
         Renames a contact record by changing its name.
         Moves the record to the new name in the address book.
         """
-        if old_name in self.data:
-            record = self.data.pop(old_name)
+        record = self.find_record(old_name)
+        if record is not None:
+            self.delete_record(record.name.value)
             record.edit_name(new_name)
-            self.data[new_name] = record
+            self.add_record(record)
         else:
             raise KeyError
 
@@ -455,6 +1410,1179 @@ class AddressBook(UserDict):
         return '\n'.join(str(record) for record in self.data.values())
 
 
+class SQLiteAddressBook(MutableMapping):
+    """
+    Address book stored in an SQLite database, with the same API as AddressBook.
+    Name, phone, email, tag and birthday columns are indexed, and Record
+    objects are only built when they are accessed, so startup time and
+    memory do not depend on the size of the book. Every change is written
+    through to the database; batch() groups changes into one transaction.
+    """
+
+    duplicate_phones = AddressBook.duplicate_phones
+    duplicate_emails = AddressBook.duplicate_emails
+    # The duplicate phone and email policies work the same way on both backends
+    check_phone = AddressBook.check_phone
+    check_email = AddressBook.check_email
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            name_key TEXT,         -- name_key(name), for completion and folded lookups
+            birthday INTEGER,      -- date.toordinal()
+            birthday_key INTEGER,  -- birthday_key(), for upcoming birthdays
+            email TEXT,
+            address TEXT,
+            note TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS phones (
+            contact_id INTEGER NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            phone TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            contact_id INTEGER NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            tag TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS contacts_email ON contacts(email);
+        CREATE INDEX IF NOT EXISTS contacts_email_nocase ON contacts(email COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS contacts_birthday_key ON contacts(birthday_key, name);
+        CREATE INDEX IF NOT EXISTS phones_phone ON phones(phone);
+        CREATE INDEX IF NOT EXISTS phones_contact ON phones(contact_id);
+        CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+        CREATE INDEX IF NOT EXISTS tags_contact ON tags(contact_id);
+    """
+    COLUMNS = 'id, name, birthday, email, address, note'
+    # Rows are turned into records this many at a time
+    FETCH_SIZE = 500
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal = None
+        import sqlite3
+        # Server mode uses the connection from one worker thread at a time
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        # Same case folding as AddressBook.search, also for non-ASCII names
+        self._conn.create_function('py_lower', 1, lambda v: v.lower() if v else v,
+                                   deterministic=True)
+        self._conn.create_function('py_fold', 1, lambda v: name_key(v) if v else v,
+                                   deterministic=True)
+        self._conn.create_function('py_domain', 1, lambda v: reversed_domain(v) if v else v,
+                                   deterministic=True)
+        self._conn.executescript(self.SCHEMA)
+        self._add_name_keys()
+        self._cache = weakref.WeakValueDictionary()  # name -> materialized Record
+        self._batch_depth = 0
+        self._names = None  # sorted (name_key, name) pairs, see suggest_names()
+
+    def _add_name_keys(self):
+        """Adds and fills the name_key column in databases made before it existed."""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(contacts)')]
+        if 'name_key' not in columns:
+            self._conn.execute('ALTER TABLE contacts ADD COLUMN name_key TEXT')
+            self._conn.execute('UPDATE contacts SET name_key = py_fold(name)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS contacts_name_key ON contacts(name_key, name)')
+        self._conn.commit()
+
+    # ---- Materializing records ----
+
+    def _records(self, sql, params=()):
+        """Yields the records selected by `sql`, building them a chunk of rows at a time."""
+        cursor = self._conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                return
+            yield from self._build(rows)
+
+    def _build(self, rows):
+        """Turns contact rows into records, reusing ones that are still alive."""
+        missing = [row for row in rows if row[1] not in self._cache]
+        phones, tags = {}, {}
+        if missing:
+            ids = [row[0] for row in missing]
+            marks = ','.join('?' * len(ids))
+            for contact_id, phone in self._conn.execute(
+                    f'SELECT contact_id, phone FROM phones WHERE contact_id IN ({marks})'
+                    ' ORDER BY contact_id, position', ids):
+                phones.setdefault(contact_id, []).append(Phone(phone))
+            for contact_id, tag in self._conn.execute(
+                    f'SELECT contact_id, tag FROM tags WHERE contact_id IN ({marks})'
+                    ' ORDER BY contact_id, position', ids):
+                tags.setdefault(contact_id, []).append(Tag(tag))
+        records = []
+        for contact_id, name, bday, email, address, note in rows:
+            record = self._cache.get(name)
+            if record is None:
+                birthday = None
+                if bday is not None:
+                    birthday = Birthday.__new__(Birthday)
+                    birthday.value = date.fromordinal(bday)
+                record = Record.__new__(Record)
+                record.__setstate__({
+                    'name': Name(name), 'phones': phones.get(contact_id, ()),
+                    'birthday': birthday, 'note': note,
+                    'tags': tags.get(contact_id, ()),
+                    'email': Email(email) if email else None, 'address': address,
+                })
+                record._book = self
+                self._cache[name] = record
+            records.append(record)
+        return records
+
+    # ---- Writing records ----
+
+    def _commit(self):
+        if not self._batch_depth:
+            self._conn.commit()
+
+    def _rollback(self):
+        """Undoes the open transaction and forgets records that may no longer match it."""
+        self._conn.rollback()
+        for record in list(self._cache.values()):
+            record._book = None
+        self._cache.clear()
+        self._names = None
+
+    def _write(self, record):
+        """Inserts or replaces the row of a record with its phones and tags."""
+        birthday = record.birthday.value if record.birthday else None
+        self._conn.execute(
+            'INSERT INTO contacts (name, name_key, birthday, birthday_key, email, address, note)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT(name) DO UPDATE SET birthday = excluded.birthday,'
+            ' birthday_key = excluded.birthday_key, email = excluded.email,'
+            ' address = excluded.address, note = excluded.note',
+            (record.name.value, name_key(record.name.value),
+             birthday.toordinal() if birthday else None,
+             birthday_key(birthday) if birthday else None,
+             record.email.value if record.email else None,
+             record.address, record.note))
+        # Looked up separately: RETURNING needs SQLite 3.35, newer than many Python 3.9 builds
+        contact_id = self._conn.execute(
+            'SELECT id FROM contacts WHERE name = ?', (record.name.value,)).fetchone()[0]
+        self._conn.execute('DELETE FROM phones WHERE contact_id = ?', (contact_id,))
+        self._conn.executemany(
+            'INSERT INTO phones (contact_id, position, phone) VALUES (?, ?, ?)',
+            [(contact_id, i, phone.value) for i, phone in enumerate(record.phones)])
+        self._conn.execute('DELETE FROM tags WHERE contact_id = ?', (contact_id,))
+        self._conn.executemany(
+            'INSERT INTO tags (contact_id, position, tag) VALUES (?, ?, ?)',
+            [(contact_id, i, tag) for i, tag in enumerate(record.get_tags())])
+
+    def _attach(self, record):
+        name = record.name.value
+        old = self._cache.get(name)
+        if old is not None and old is not record:
+            old._book = None
+        record._book = self
+        self._cache[name] = record
+        self._write(record)
+        self._track_name(name)
+
+    def _before_change(self, record):
+        """Called by Record mutators before the record changes."""
+
+    def _after_change(self, record, changed=True):
+        """Called by Record mutators after the record changed (or failed to)."""
+        if changed:
+            self._write(record)
+            self._commit()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups many changes into one transaction. If an exception escapes
+        the outermost batch, the transaction is rolled back instead.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._rollback()
+            raise
+        else:
+            self._batch_depth -= 1
+            self._commit()
+
+    # ---- AddressBook API ----
+
+    def add_record(self, record):
+        """Adds a new contact record to the address book."""
+        self._attach(record)
+        self._commit()
+
+    def add_records(self, records):
+        """Adds many records in one transaction. Returns the number added."""
+        count = 0
+        with self.batch():
+            for record in records:
+                self._attach(record)
+                count += 1
+        return count
+
+    def _find_exact(self, name):
+        """Finds a contact record by its exact name."""
+        record = self._cache.get(name)
+        if record is not None:
+            return record
+        found = self._build(self._conn.execute(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE name = ?', (name,)).fetchall())
+        return found[0] if found else None
+
+    # Falls back to names that differ in case or accents, like AddressBook
+    find_record = AddressBook.find_record
+
+    def complete(self, prefix, limit=10):
+        """Returns up to `limit` contact names starting with prefix, ignoring case and accents."""
+        key = name_key(prefix)
+        # A range over the indexed folded names: every key that starts with key
+        return [name for name, in self._conn.execute(
+            'SELECT name FROM contacts WHERE name_key >= :k AND name_key < :k || char(1114111)'
+            ' ORDER BY name_key, name LIMIT :n', {'k': key, 'n': int(limit)})]
+
+    def suggest_names(self, name, distance=None, limit=5):
+        """
+        Returns up to `limit` contact names within `distance` typos of name,
+        closest first, like AddressBook.suggest_names. The sorted folded
+        names are read on the first call and kept up to date after.
+        """
+        if distance is None:
+            distance = 1 if len(name_key(name)) <= 3 else 2
+        if self._names is None:
+            self._names = self._conn.execute(
+                'SELECT name_key, name FROM contacts ORDER BY name_key, name').fetchall()
+        return [match for _, match in fuzzy_names(self._names, name, distance)[:limit]]
+
+    def _track_name(self, name, present=True):
+        """Keeps the names read by suggest_names() in step with the table."""
+        if self._names is None:
+            return
+        entry = (name_key(name), name)
+        AddressBook._discard(self._names, entry)
+        if present:
+            bisect.insort(self._names, entry)
+
+    def delete_record(self, name):
+        """Deletes a contact record by name."""
+        self._conn.execute('DELETE FROM contacts WHERE name = ?', (name,))
+        self._commit()
+        record = self._cache.pop(name, None)
+        if record is not None:
+            record._book = None
+        self._track_name(name, present=False)
+
+    def rename_record(self, old_name, new_name):
+        """
+        Renames a contact record by changing its name.
+        Moves the record to the new name in the address book.
+        """
+        record = self.find_record(old_name)
+        if record is None:
+            raise KeyError
+        old_name = record.name.value
+        with self.batch():
+            if new_name != old_name:
+                # Renaming over another contact replaces it, as in AddressBook
+                self.delete_record(new_name)
+            self._conn.execute('UPDATE contacts SET name = ?, name_key = ? WHERE name = ?',
+                               (new_name, name_key(new_name), old_name))
+            del self._cache[old_name]
+            record._book = None
+            record.edit_name(new_name)
+            record._book = self
+            self._cache[new_name] = record
+            self._track_name(old_name, present=False)
+            self._track_name(new_name)
+
+    def iter_records(self, offset=0):
+        """Iterates over the records from `offset` on, in insertion order."""
+        return self._records(
+            f'SELECT {self.COLUMNS} FROM contacts ORDER BY id LIMIT -1 OFFSET ?', (offset,))
+
+    def search(self, query):
+        """Yields records whose name, phone, email or note contains the query, by name."""
+        query = query.lower()
+        return self._records(
+            f'SELECT {self.COLUMNS} FROM contacts'
+            ' WHERE instr(py_lower(name), :q) OR instr(py_lower(email), :q)'
+            ' OR instr(py_lower(note), :q)'
+            ' OR id IN (SELECT contact_id FROM phones WHERE instr(phone, :q))'
+            ' ORDER BY name', {'q': query})
+
+    def find_by_phone(self, phone):
+        """Returns the records that own the phone number."""
+        return list(self._records(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE id IN'
+            ' (SELECT contact_id FROM phones WHERE phone = ?) ORDER BY id', (phone,)))
+
+    def find_by_email(self, email):
+        """Returns the records with the email address, ignoring case."""
+        return list(self._records(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE email = ? COLLATE NOCASE'
+            ' ORDER BY id', (email.strip(),)))
+
+    def search_by_domain(self, domain):
+        """Returns the records with an email address at the domain or a subdomain, by name."""
+        return list(self._records(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE py_domain(email) = :d'
+            " OR substr(py_domain(email), 1, length(:d) + 1) = :d || '.'"
+            ' ORDER BY name', {'d': reversed_domain(domain)}))
+
+    def search_by_tag(self, tag):
+        """Returns the records with the tag."""
+        return list(self._records(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE id IN'
+            ' (SELECT contact_id FROM tags WHERE tag = ?) ORDER BY id', (tag,)))
+
+    def search_notes(self, query, limit=None):
+        """Returns the records whose notes or tags best match the words of the query."""
+        index = NoteIndex()
+        records = {}
+        for record in self.iter_records():
+            index.add(record)
+            records[record.name.value] = record
+        return [records[name] for name in index.rank(query, limit)]
+
+    def get_all_tags(self):
+        """Returns all unique tags, sorted."""
+        return [tag for tag, in self._conn.execute('SELECT DISTINCT tag FROM tags ORDER BY tag')]
+
+    def get_contacts_by_tags(self, tags):
+        """Returns the records that have all of the tags."""
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return list(self.iter_records())
+        marks = ','.join('?' * len(tags))
+        return list(self._records(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE id IN'
+            f' (SELECT contact_id FROM tags WHERE tag IN ({marks})'
+            '  GROUP BY contact_id HAVING COUNT(DISTINCT tag) = ?) ORDER BY id',
+            (*tags, len(tags))))
+
+    def search_by_tags(self, query):
+        """
+        Returns the records matching a tag query, by name. The query is
+        translated into INTERSECT / UNION / EXCEPT over the tags index.
+        """
+        if isinstance(query, str):
+            query = TagQuery(query)
+        params = []
+
+        def sql(node):
+            kind, value = node
+            if kind == 'tag':
+                params.append(value)
+                return 'SELECT contact_id FROM tags WHERE tag = ?'
+            if kind == 'not':
+                return f'SELECT id FROM contacts EXCEPT SELECT * FROM ({sql(value)})'
+            operator = ' INTERSECT ' if kind == 'and' else ' UNION '
+            return operator.join(f'SELECT * FROM ({sql(child)})' for child in value)
+        where = sql(query.tree)
+        return list(self._records(
+            f'SELECT {self.COLUMNS} FROM contacts WHERE id IN ({where}) ORDER BY name', params))
+
+    def upcoming_birthday(self, days=7, today=None):
+        """
+        Finds contacts with upcoming birthdays within the specified number of days.
+        Returns a list of records ordered by the upcoming date.
+        """
+        today = today or datetime.now().date()
+        records = []
+        for first_key, last_key in birthday_windows(days, today):
+            records.extend(self._records(
+                f'SELECT {self.COLUMNS} FROM contacts WHERE birthday_key BETWEEN ? AND ?'
+                ' ORDER BY birthday_key, name', (first_key, last_key)))
+        return records
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    # ---- Mapping interface ----
+
+    def __getitem__(self, name):
+        record = self._find_exact(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def __setitem__(self, name, record):
+        self.add_record(record)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.delete_record(name)
+
+    def __contains__(self, name):
+        return self._conn.execute(
+            'SELECT 1 FROM contacts WHERE name = ?', (name,)).fetchone() is not None
+
+    def __iter__(self):
+        for name, in self._conn.execute('SELECT name FROM contacts ORDER BY id'):
+            yield name
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM contacts').fetchone()[0]
+
+
+# ============ Columnar snapshot ==================================
+# An .abk file starts with a header (magic, number of records, and the
+# start and length of every section). Each text column has a data section
+# holding the UTF-8 values back to back and an offsets section with
+# count + 1 little-endian uint64 offsets into it. Birthdays are stored as
+# int32 ordinals (0 = not set) and uint16 birthday keys. Records are
+# sorted by name, so a name lookup is a binary search.
+
+COLUMNAR_MAGIC = b'ABKCOL02'  # Ends with a SNAPSHOT_TRAILER checksum
+COLUMNAR_MAGIC_V1 = b'ABKCOL01'  # Written by older versions, without a checksum
+COLUMNAR_EXTENSIONS = ('.abk',)
+COLUMNAR_TEXT = ('name', 'phones', 'email', 'address', 'note', 'tags', 'search')
+COLUMNAR_NUMBERS = {'birthday': 'i', 'birthday_key': 'H'}
+COLUMNAR_SECTIONS = tuple(section for column in COLUMNAR_TEXT
+                          for section in (column, column + '_offsets')) + tuple(COLUMNAR_NUMBERS)
+COLUMNAR_HEADER = struct.Struct(f'<8sQ{2 * len(COLUMNAR_SECTIONS)}Q')
+# Separates list items (phones, tags, search fields) and ends each search text
+LIST_SEPARATOR, RECORD_END = '\x1f', '\x1e'
+
+
+# Function to pack phones or tags so that an exact item can be found with
+# a single bytes search for SEPARATOR + item + SEPARATOR
+def pack_list(values):
+    values = list(values)
+    if not values:
+        return b''
+    return (LIST_SEPARATOR + LIST_SEPARATOR.join(values) + LIST_SEPARATOR).encode()
+
+
+# Function to get the value a record stores in a column of the snapshot
+def record_column(record, column):
+    if column == 'name':
+        return record.name.value.encode()
+    if column == 'phones':
+        return pack_list(phone.value for phone in record.phones)
+    if column == 'email':
+        return record.email.value.encode() if record.email else b''
+    if column == 'address':
+        return (record.address or '').encode()
+    if column == 'note':
+        return record.note.encode()
+    if column == 'tags':
+        return pack_list(record.get_tags())
+    if column == 'search':
+        return (LIST_SEPARATOR.join(record.search_fields()) + RECORD_END).encode()
+    if column == 'birthday':
+        return record.birthday.value.toordinal() if record.birthday else 0
+    if column == 'birthday_key':
+        return birthday_key(record.birthday.value) if record.birthday else 0
+    raise ValueError(f'Unknown column {column}')
+
+
+def write_columnar(filename, rows, before_replace=None):
+    """
+    Writes a columnar snapshot to `filename` through a temporary file.
+    `rows` is a callable returning a fresh iterator over the rows in name
+    order; each row is a function mapping a column name to its value.
+    It is called once per column, so memory does not grow with the book.
+    Like write_snapshot, the file ends with a checksum, is synced before it
+    is renamed into place and the snapshot it replaces is kept as
+    `filename.prev`. `before_replace` is called just before the rename.
+    """
+    import zlib
+    from array import array
+
+    def align(f):
+        f.write(b'\0' * (-f.tell() % 8))
+        return f.tell()
+
+    def little_endian(values):
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tobytes()
+
+    table, count = [], 0
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b'\0' * COLUMNAR_HEADER.size)
+        for column in COLUMNAR_TEXT:
+            start = align(f)
+            offsets = array('Q', [0])
+            for row in rows():
+                value = row(column)
+                f.write(value)
+                offsets.append(offsets[-1] + len(value))
+            count = len(offsets) - 1
+            table += [start, offsets[-1], align(f), len(offsets) * 8]
+            f.write(little_endian(offsets))
+        for column, code in COLUMNAR_NUMBERS.items():
+            values = array(code, (row(column) for row in rows()))
+            start = align(f)
+            f.write(little_endian(values))
+            table += [start, len(values) * values.itemsize]
+        f.seek(0)
+        f.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, count, *table))
+        # The header is written last, so the checksum is taken over the finished file
+        f.flush()
+        length = f.seek(0, os.SEEK_END)
+        checksum = 0
+        with open(tmp, 'rb') as written:
+            while chunk := written.read(1 << 20):
+                checksum = zlib.crc32(chunk, checksum)
+        f.write(SNAPSHOT_TRAILER.pack(checksum, length))
+        f.flush()
+        os.fsync(f.fileno())
+    if before_replace is not None:
+        before_replace()
+    install_snapshot(tmp, filename)
+
+
+class ColumnarAddressBook(MutableMapping):
+    """
+    Address book read from a memory-mapped columnar snapshot (.abk).
+    Opening it only reads the header, so startup does not depend on the
+    size of the book; records are decoded when they are accessed and
+    searches run as bytes searches over the packed columns.
+    Changes are kept in an in-memory overlay, journaled like AddressBook
+    and merged into a new snapshot when the journal is compacted.
+    """
+
+    duplicate_phones = AddressBook.duplicate_phones
+    duplicate_emails = AddressBook.duplicate_emails
+    # The duplicate phone and email policies work the same way on all backends
+    check_phone = AddressBook.check_phone
+    check_email = AddressBook.check_email
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal = None
+        self._changes = {}  # name -> changed Record, or None when deleted
+        self._mmap = None
+        self._open()
+
+    # ---- Reading the snapshot ----
+
+    def _open(self):
+        """
+        Maps the snapshot after checking its checksum, falling back to the
+        previous generation (`filename.prev`) when it is missing or damaged,
+        like load_snapshot. A new, empty snapshot is made if neither exists.
+        """
+        errors = []
+        for candidate in (self.filename, self.filename + '.prev'):
+            try:
+                self._mmap = self._map(candidate)
+            except FileNotFoundError:
+                continue
+            except ValueError as e:
+                errors.append(f'{candidate}: {e}')
+                continue
+            if errors:
+                print(Fore.YELLOW + f'Warning: {errors[0]}; loaded the previous snapshot, '
+                      'changes saved since then may be missing' + Style.RESET_ALL,
+                      file=sys.stderr)
+            break
+        else:
+            if errors:
+                raise ValueError('Cannot load the address book: ' + '; '.join(errors))
+            write_columnar(self.filename, lambda: iter(()))
+            self._mmap = self._map(self.filename)
+        magic, self._count, *table = COLUMNAR_HEADER.unpack_from(self._mmap)
+        self._sections = {section: (table[2 * i], table[2 * i + 1])
+                          for i, section in enumerate(COLUMNAR_SECTIONS)}
+        self._changes = {}
+        self._size = self._count
+        self._names = None  # sorted (name_key, name) pairs of the snapshot, see _snapshot_names()
+
+    @staticmethod
+    def _map(filename):
+        """Maps a snapshot file; raises ValueError if it is not one or is damaged."""
+        import mmap
+        import zlib
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < COLUMNAR_HEADER.size:
+                raise ValueError('the file is truncated')
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = mapped[:len(COLUMNAR_MAGIC)]
+        if magic == COLUMNAR_MAGIC_V1:
+            return mapped
+        error = None
+        if magic != COLUMNAR_MAGIC:
+            error = 'not a columnar address book'
+        elif len(mapped) < COLUMNAR_HEADER.size + SNAPSHOT_TRAILER.size:
+            error = 'the file is truncated'
+        else:
+            end = len(mapped) - SNAPSHOT_TRAILER.size
+            checksum, length = SNAPSHOT_TRAILER.unpack_from(mapped, end)
+            if length != end:
+                error = 'the file is truncated'
+            else:
+                # Views are released before the map can be closed
+                with memoryview(mapped) as view, view[:length] as body:
+                    if zlib.crc32(body) != checksum:
+                        error = 'the file is damaged (checksum mismatch)'
+        if error is not None:
+            mapped.close()
+            raise ValueError(error)
+        return mapped
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _bounds(self, column, i):
+        """Returns the start and end of value i inside the column's data section."""
+        return struct.unpack_from('<2Q', self._mmap, self._sections[column + '_offsets'][0] + 8 * i)
+
+    def _raw(self, i, column):
+        """Returns value i of a column as stored: bytes, or an int for numbers."""
+        if column in COLUMNAR_NUMBERS:
+            code = '<' + COLUMNAR_NUMBERS[column]
+            return struct.unpack_from(code, self._mmap,
+                                      self._sections[column][0] + struct.calcsize(code) * i)[0]
+        base = self._sections[column][0]
+        start, end = self._bounds(column, i)
+        return self._mmap[base + start:base + end]
+
+    def _text(self, column, i):
+        return self._raw(i, column).decode()
+
+    def _index_of(self, name):
+        """Binary search for the position of `name` in the snapshot, or None."""
+        key = name.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._raw(mid, 'name') < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._raw(lo, 'name') == key:
+            return lo
+        return None
+
+    def _position(self, column, offset):
+        """Returns the record whose value in `column` covers the data offset."""
+        lo, hi = 0, self._count - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._bounds(column, mid)[0] <= offset:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def _find_all(self, column, needle):
+        """Yields, in name order, the positions whose `column` value contains needle."""
+        base, length = self._sections[column]
+        end = base + length
+        found = self._mmap.find(needle, base, end)
+        while found != -1:
+            i = self._position(column, found - base)
+            yield i
+            found = self._mmap.find(needle, base + self._bounds(column, i)[1], end)
+
+    def _decode(self, i):
+        """Builds the Record stored at position i."""
+        def items(column):
+            return [v for v in self._text(column, i).split(LIST_SEPARATOR) if v]
+        birthday = None
+        ordinal = self._raw(i, 'birthday')
+        if ordinal:
+            birthday = Birthday.__new__(Birthday)
+            birthday.value = date.fromordinal(ordinal)
+        email = self._text('email', i)
+        record = Record.__new__(Record)
+        record.__setstate__({
+            'name': Name(self._text('name', i)),
+            'phones': [Phone(phone) for phone in items('phones')],
+            'birthday': birthday,
+            'note': self._text('note', i),
+            'tags': [Tag(tag) for tag in items('tags')],
+            'email': Email(email) if email else None,
+            'address': self._text('address', i) or None,
+        })
+        record._book = self
+        return record
+
+    def _base_records(self, positions):
+        """Decodes snapshot positions, skipping contacts changed since the snapshot."""
+        for i in positions:
+            if self._changes and self._text('name', i) in self._changes:
+                continue
+            yield self._decode(i)
+
+    def _merge(self, base, matches):
+        """Merges snapshot records with the changed records that match, by name."""
+        import heapq
+        changed = sorted((record for record in self._changes.values()
+                          if record is not None and matches(record)),
+                         key=lambda record: record.name.value)
+        return heapq.merge(base, changed, key=lambda record: record.name.value)
+
+    def _rows(self):
+        """Yields the rows of the merged book for write_columnar, in name order."""
+        import heapq
+
+        def base():
+            for i in range(self._count):
+                name = self._text('name', i)
+                if name not in self._changes:
+                    yield name, functools.partial(self._raw, i)
+        changed = sorted((name, functools.partial(record_column, record))
+                         for name, record in self._changes.items() if record is not None)
+        for _, row in heapq.merge(base(), changed, key=lambda item: item[0]):
+            yield row
+
+    # ---- Writing ----
+
+    def _before_change(self, record):
+        """Called by Record mutators before the record changes."""
+
+    def _after_change(self, record, changed=True):
+        """Called by Record mutators after the record changed (or failed to)."""
+        if changed:
+            self._changes[record.name.value] = record
+            self._journal('put', record)
+
+    def _journal(self, op, arg):
+        """Appends a change to the journal and compacts it when it grows too long."""
+        journal = self.journal
+        if journal is None:
+            return
+        journal.append(op, arg)
+        # Changes are searched in memory, so the overlay is kept smaller than the book
+        if journal.entries >= max(journal.compact_every, self._count // 4):
+            save_data(self, journal.snapshot)
+
+    def save(self, filename):
+        """Writes the book with its changes as a new snapshot."""
+        if filename != self.filename:
+            write_columnar(filename, self._rows)
+            return
+        # A mapped file cannot be replaced on Windows
+        write_columnar(filename, self._rows, before_replace=self.close)
+        self._open()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups many changes: the journal is paused and one snapshot
+        is written at the end instead.
+        """
+        journal, self.journal = self.journal, None
+        try:
+            yield self
+        finally:
+            self.journal = journal
+            if journal is not None:
+                save_data(self, journal.snapshot)
+
+    # ---- AddressBook API ----
+
+    def add_record(self, record):
+        """Adds a new contact record to the address book."""
+        name = record.name.value
+        old = self._changes.get(name)
+        if old is record:
+            return
+        if old is not None:
+            old._book = None
+        if name not in self:
+            self._size += 1
+        self._changes[name] = record
+        record._book = self
+        self._journal('put', record)
+
+    def add_records(self, records):
+        """Adds many records, replacing contacts with the same name. Returns the count."""
+        count = 0
+        for record in records:
+            self.add_record(record)
+            count += 1
+        return count
+
+    def _find_exact(self, name):
+        """Finds a contact record by its exact name."""
+        if name in self._changes:
+            return self._changes[name]
+        i = self._index_of(name)
+        return None if i is None else self._decode(i)
+
+    # Falls back to names that differ in case or accents, like AddressBook
+    find_record = AddressBook.find_record
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to `limit` contact names starting with prefix, ignoring
+        case and accents. The snapshot names are folded and sorted once,
+        on the first call; changed contacts are merged in from the overlay.
+        """
+        import heapq
+        names = self._snapshot_names()
+        key = name_key(prefix)
+        lo = bisect.bisect_left(names, (key,))
+        base = (names[i] for i in range(lo, len(names)) if names[i][1] not in self._changes)
+        changed = sorted((name_key(name), name) for name, record in self._changes.items()
+                         if record is not None and name_key(name).startswith(key))
+        merged = takewhile(lambda entry: entry[0].startswith(key), heapq.merge(base, changed))
+        return [name for _, name in islice(merged, limit)]
+
+    def suggest_names(self, name, distance=None, limit=5):
+        """
+        Returns up to `limit` contact names within `distance` typos of name,
+        closest first, like AddressBook.suggest_names. The snapshot names
+        and the few contacts changed since are searched separately.
+        """
+        if distance is None:
+            distance = 1 if len(name_key(name)) <= 3 else 2
+        changed = sorted((name_key(found), found)
+                         for found, record in self._changes.items() if record is not None)
+        found = [(d, match) for d, match in fuzzy_names(self._snapshot_names(), name, distance)
+                 if match not in self._changes]
+        found += fuzzy_names(changed, name, distance)
+        return [match for _, match in sorted(found)[:limit]]
+
+    def _snapshot_names(self):
+        """Returns the snapshot's (name_key, name) pairs, sorted; folded on the first call."""
+        if self._names is None:
+            self._names = sorted((name_key(self._text('name', i)), self._text('name', i))
+                                 for i in range(self._count))
+        return self._names
+
+    def delete_record(self, name):
+        """Deletes a contact record by name."""
+        if name not in self:
+            return
+        old = self._changes.get(name)
+        if old is not None:
+            old._book = None
+        self._changes[name] = None
+        self._size -= 1
+        self._journal('del', name)
+
+    def rename_record(self, old_name, new_name):
+        """
+        Renames a contact record by changing its name.
+        Moves the record to the new name in the address book.
+        """
+        record = self.find_record(old_name)
+        if record is None:
+            raise KeyError
+        self.delete_record(record.name.value)
+        record._book = None
+        record.edit_name(new_name)
+        self.add_record(record)
+
+    def iter_records(self, offset=0):
+        """Iterates over the records from `offset` on, in name order."""
+        return islice(self._merge(self._base_records(range(self._count)),
+                                  lambda record: True), offset, None)
+
+    def search(self, query):
+        """Yields records whose name, phone, email or note contains the query, by name."""
+        query = query.lower()
+        positions = self._find_all('search', query.encode()) if query else range(self._count)
+        return self._merge(
+            self._base_records(positions),
+            lambda record: any(query in field for field in record.search_fields()))
+
+    def find_by_phone(self, phone):
+        """Returns the records that own the phone number."""
+        return list(self._merge(
+            self._base_records(self._find_all('phones', pack_list([phone]))),
+            lambda record: record.find_phone(phone) is not None))
+
+    def find_by_email(self, email):
+        """Returns the records with the email address, ignoring case."""
+        key = email_key(email)
+
+        def matches(record):
+            return record.email is not None and email_key(record.email.value) == key
+        # The bytes search also finds the address inside notes, so hits are checked
+        return list(self._merge(
+            filter(matches, self._base_records(self._find_all('search', key.encode()))),
+            matches))
+
+    def search_by_domain(self, domain):
+        """Returns the records with an email address at the domain or a subdomain, by name."""
+        key = reversed_domain(domain)
+        domain = '.'.join(reversed(key.split('.')))
+
+        def matches(record):
+            if record.email is None:
+                return False
+            found = reversed_domain(record.email.value)
+            return found == key or found.startswith(key + '.')
+        return list(self._merge(
+            filter(matches, self._base_records(self._find_all('search', domain.encode()))),
+            matches))
+
+    def search_by_tag(self, tag):
+        """Returns the records with the tag."""
+        return list(self._merge(
+            self._base_records(self._find_all('tags', pack_list([tag]))),
+            lambda record: record.has_tag(tag)))
+
+    def search_notes(self, query, limit=None):
+        """Returns the records whose notes or tags best match the words of the query."""
+        index = NoteIndex()
+        records = {}
+        for record in self.iter_records():
+            index.add(record)
+            records[record.name.value] = record
+        return [records[name] for name in index.rank(query, limit)]
+
+    def get_all_tags(self):
+        """Returns all unique tags, sorted."""
+        base, length = self._sections['tags']
+        counts = Counter(self._mmap[base:base + length].decode().split(LIST_SEPARATOR))
+        del counts['']
+        for name, record in self._changes.items():
+            i = self._index_of(name)
+            if i is not None:
+                counts.subtract(v for v in self._text('tags', i).split(LIST_SEPARATOR) if v)
+            if record is not None:
+                counts.update(record.get_tags())
+        return sorted(tag for tag, count in counts.items() if count > 0)
+
+    def get_contacts_by_tags(self, tags):
+        """Returns the records that have all of the tags."""
+        if not tags:
+            return list(self.iter_records())
+        return self.search_by_tags(TagQuery.all_of(tags))
+
+    def search_by_tags(self, query):
+        """
+        Returns the records matching a tag query, by name. Snapshot
+        positions serve as record ids for the bitmaps; contacts changed
+        since the snapshot are checked one by one.
+        """
+        if isinstance(query, str):
+            query = TagQuery(query)
+        bitmaps = {}
+
+        def bitmap(tag):
+            if tag not in bitmaps:
+                bitmaps[tag] = bitmap_from_ids(self._find_all('tags', pack_list([tag])))
+            return bitmaps[tag]
+        bits = query.evaluate(bitmap, lambda tag: bin(bitmap(tag)).count('1'),
+                              lambda: (1 << self._count) - 1)
+        return list(self._merge(self._base_records(ids_from_bitmap(bits)),
+                                lambda record: query.matches(record.get_tags())))
+
+    def upcoming_birthday(self, days=7, today=None):
+        """
+        Finds contacts with upcoming birthdays within the specified number of days.
+        Returns a list of records ordered by the upcoming date.
+        """
+        from array import array
+        today = today or datetime.now().date()
+        start, length = self._sections['birthday_key']
+        keys = array('H', self._mmap[start:start + length])
+        if sys.byteorder == 'big':
+            keys.byteswap()
+        records = []
+        for first_key, last_key in birthday_windows(days, today):
+            positions = (i for i, key in enumerate(keys) if first_key <= key <= last_key)
+            found = list(self._base_records(positions))
+            found += [record for record in self._changes.values()
+                      if record is not None and record.birthday
+                      and first_key <= birthday_key(record.birthday.value) <= last_key]
+            found.sort(key=lambda record: (birthday_key(record.birthday.value), record.name.value))
+            records += found
+        return records
+
+    # ---- Mapping interface ----
+
+    def __getitem__(self, name):
+        record = self._find_exact(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def __setitem__(self, name, record):
+        self.add_record(record)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.delete_record(name)
+
+    def __contains__(self, name):
+        if name in self._changes:
+            return self._changes[name] is not None
+        return self._index_of(name) is not None
+
+    def __iter__(self):
+        for record in self.iter_records():
+            yield record.name.value
+
+    def __len__(self):
+        return self._size
+
+
+# ============ Parallel scan ==================================
+
+# Shard of the book held by a ParallelScan worker process:
+# (name, searchable text, lowercased note, lowercased tags) per record
+_SHARD = {}  # record name -> scan_row() of the record, in book order
+
+
+def load_shard(rows):
+    """Runs in a worker process: keeps its shard for the following scans."""
+    global _SHARD
+    _SHARD = rows
+
+
+def update_shard(rows, deleted):
+    """Runs in a worker process: applies the changes made to its shard."""
+    for name in deleted:
+        _SHARD.pop(name, None)
+    _SHARD.update(rows)  # Changed rows keep their place, new ones go last
+
+
+def scan_shard(query, kind):
+    """Runs in a worker process: returns the names in the shard that match, in order."""
+    if kind == 'notes':
+        return [name for name, row in _SHARD.items() if query in row[1] or query in row[2]]
+    return [name for name, row in _SHARD.items() if query in row[0]]
+
+
+# Function to turn a record into the row a ParallelScan worker searches
+def scan_row(record):
+    return (LIST_SEPARATOR.join(record.search_fields()),
+            record.note.lower(),
+            ' '.join(record.get_tags()).lower())
+
+
+class ParallelScan:
+    """
+    Opt-in parallel substring scan for very large in-memory books.
+    The records are split into one contiguous shard per worker process;
+    each worker keeps its shard between queries, so a query only sends
+    the query string and receives matching names. After the book changes,
+    only the changed rows are sent, to the shards that hold them; contacts
+    added since the shards were made go to the last shard. Results come in
+    the same order as the serial scans: contacts by name, notes in book order.
+    """
+
+    def __init__(self, workers=None, min_records=100000):
+        import threading
+        self.workers = workers or os.cpu_count() or 1
+        self.min_records = min_records  # Smaller books are scanned in process
+        self._pools = []
+        self._book = None
+        self._version = None
+        self._shard_of = {}  # record name -> index of the shard holding it
+        self._sizes = []  # number of records in each shard
+        # Server mode runs queries from several threads; one at a time
+        # brings the shards up to date and queues its scan
+        self._lock = threading.Lock()
+
+    def applies(self, book):
+        """Tells whether the book is an in-memory book large enough to shard."""
+        return isinstance(book, AddressBook) and len(book) >= self.min_records
+
+    def _load(self, book):
+        """Splits the whole book into shards and sends one to each worker."""
+        from concurrent.futures import ProcessPoolExecutor
+        if not self._pools:
+            # One single-process pool per shard, so each shard stays with its worker
+            self._pools = [ProcessPoolExecutor(1) for _ in range(self.workers)]
+        names = list(book.data)
+        size = -(-len(names) // self.workers)
+        shards = [names[i * size:(i + 1) * size] for i in range(self.workers)]
+        futures = [pool.submit(load_shard, {name: scan_row(book.data[name]) for name in shard})
+                   for pool, shard in zip(self._pools, shards)]
+        self._shard_of = {name: i for i, shard in enumerate(shards) for name in shard}
+        self._sizes = [len(shard) for shard in shards]
+        for future in futures:
+            future.result()
+        self._book = weakref.ref(book)
+        self._version = book.version
+
+    def _update(self, book, changes):
+        """
+        Sends the rows of the changed contacts to the shards holding them.
+        Returns False when the shards have to be rebuilt instead.
+        """
+        last = len(self._pools) - 1
+        rows = [{} for _ in self._pools]
+        deleted = [[] for _ in self._pools]
+        added = set()
+        for name, moved in changes.items():
+            shard = self._shard_of.get(name)
+            if shard is not None and (moved or name not in book.data):
+                deleted[shard].append(name)
+                del self._shard_of[name]
+                self._sizes[shard] -= 1
+                shard = None
+            if name in book.data:
+                if shard is None:
+                    added.add(name)
+                else:
+                    rows[shard][name] = scan_row(book.data[name])
+        if added:
+            # New and re-added contacts are the last ones in the book
+            tail = list(islice(reversed(book.data), len(added)))[::-1]
+            if set(tail) != added:
+                return False
+            for name in tail:
+                rows[last][name] = scan_row(book.data[name])
+                self._shard_of[name] = last
+            self._sizes[last] += len(tail)
+        if self._sizes[last] > 2 * (len(book.data) // len(self._pools) + 1):
+            return False  # The last shard has grown too big: rebalance
+        futures = [pool.submit(update_shard, shard_rows, shard_deleted)
+                   for pool, shard_rows, shard_deleted in zip(self._pools, rows, deleted)
+                   if shard_rows or shard_deleted]
+        for future in futures:
+            future.result()
+        self._version = book.version
+        return True
+
+    def search(self, book, query, kind='contacts'):
+        """
+        Yields, in name order, the records whose searchable fields
+        ('contacts') or note and tags ('notes') contain the lowercased query.
+        """
+        with self._lock:
+            if self._book is None or self._book() is not book:
+                self._load(book)
+            elif self._version != book.version:
+                changes = book.changes_since(self._version)
+                if changes is None or not self._update(book, changes):
+                    self._load(book)
+            futures = [pool.submit(scan_shard, query, kind) for pool in self._pools]
+        names = [name for future in futures for name in future.result()]
+        if kind == 'contacts':
+            names.sort()
+        for name in names:
+            yield book.data[name]
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools:
+                pool.shutdown()
+            self._pools = []
+            self._book = None
+
+
+# Parallel scanner used by search_contacts and search_notes, or None when off
+PARALLEL_SCAN = None
+
+
 @exception_handler
 def add_address(book, name, address):
     """
@@ -514,9 +2642,13 @@ def add_contact(book, name, phone):
     If the contact already exists, adds the phone number to the existing contact.
     """
     record = book.find_record(name) or Record(name)
+    warning = book.check_phone(phone, record.name.value)
     record.add_phone(phone)
     book.add_record(record)
-    return Fore.GREEN + f'Contact {name} with number {phone} has been added' + Style.RESET_ALL
+    message = Fore.GREEN + f'Contact {name} with number {phone} has been added' + Style.RESET_ALL
+    if warning:
+        message += '\n' + Fore.YELLOW + f'Warning: {warning}' + Style.RESET_ALL
+    return message
 
 
 @exception_handler
@@ -527,8 +2659,12 @@ def change_contact(book, name, old_phone, new_phone):
     """
     record = book.find_record(name)
     if record:
+        warning = book.check_phone(new_phone, record.name.value)
         record.edit_phone(old_phone, new_phone)
-        return Fore.GREEN + f'Contact {name} updated' + Style.RESET_ALL
+        message = Fore.GREEN + f'Contact {name} updated' + Style.RESET_ALL
+        if warning:
+            message += '\n' + Fore.YELLOW + f'Warning: {warning}' + Style.RESET_ALL
+        return message
     raise KeyError  # 'Contact not found'
 
 
@@ -589,7 +2725,8 @@ def show_note(book, name):
     record = book.find_record(name)
     if record and record.note:
         return f'Note for {name}: {record.note}'
-    return Fore.YELLOW + 'Note not found' + Style.RESET_ALL
+    message = Fore.YELLOW + 'Note not found' + Style.RESET_ALL
+    return message if record else command_failed(message + did_you_mean(book, name))
 
 
 def show_phone(book, name):
@@ -602,39 +2739,63 @@ def show_phone(book, name):
         if record.phones:
             return ', '.join(phone.value for phone in record.phones)
         return Fore.YELLOW + 'No phone numbers found for this contact' + Style.RESET_ALL
-    return Fore.YELLOW + 'Contact was not found' + Style.RESET_ALL
+    return command_failed(Fore.YELLOW + 'Contact was not found' + Style.RESET_ALL
+                          + did_you_mean(book, name))
 
 
-def search_contacts(book, query):
+def who_has_phone(book, phone):
     """
-    Searches for contacts in the address book by name, phone number, email, or notes.
-    Returns a list of matching contacts or raises an error if no matches are found.
+    Shows which contacts own a phone number.
+    Returns a message if nobody has it.
     """
-    query_lower = query.lower()
-    results = []
+    records = book.find_by_phone(phone)
+    if records:
+        names = ', '.join(record.name.value for record in records)
+        return f'Phone {phone} belongs to: {names}'
+    return Fore.YELLOW + f'Nobody has phone {phone}' + Style.RESET_ALL
 
-    for record in book.data.values():
-        name_match = query_lower in record.name.value.lower()
-        phone_match = any(query_lower in str(phone.value).lower()
-                          for phone in record.phones)
-        email_match = record.email and query_lower in record.email.value.lower()
-        note_match = query_lower in record.note.lower() if record.note else False
 
-        if name_match or phone_match or email_match or note_match:
-            results.append(str(record))
+@exception_handler
+def complete_name(book, prefix, limit=10):
+    """
+    Shows up to `limit` contact names that start with prefix,
+    ignoring case and accents ('jo' also finds 'José').
+    """
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError('Number of names must be positive')
+    names = book.complete(prefix, limit)
+    if names:
+        return '\n'.join(names)
+    return Fore.YELLOW + f'No contacts starting with {prefix}' + Style.RESET_ALL
+
 
-    if results:
-        return "\n".join(results)
+@exception_handler
+def search_contacts(book, query, limit=None, offset=0):
+    """
+    Searches for contacts in the address book by name, phone number, email, or notes.
+    Streams one page of matching contacts or raises an error if no matches are found.
+    """
+    if PARALLEL_SCAN is not None and len(query) < 3 and PARALLEL_SCAN.applies(book):
+        # Too short for the trigram index to narrow the search down
+        results = PARALLEL_SCAN.search(book, query.lower())
+    else:
+        results = book.search(query)
+    page = paginate(results, limit, offset)
+    if page:
+        return page
 
     raise KeyError("Contact not found")
 
 
-def show_all(book):
+@exception_handler
+def show_all(book, limit=None, offset=0):
     """
-    Displays all contacts in the address book.
+    Streams one page of the contacts in the address book.
     Returns a message if the address book is empty.
     """
-    return str(book) if book else 'The contact list is empty'
+    page = paginate(book.iter_records, limit, offset)
+    return page or 'The contact list is empty'
 
 
 @exception_handler
@@ -643,9 +2804,10 @@ def delete_contact(book, name):
     Deletes a contact from the address book by name.
     Raises an error if the contact is not found.
     """
-    if book.find_record(name):
-        book.delete_record(name)
-        return Fore.GREEN + f'Contact {name} was deleted' + Style.RESET_ALL
+    record = book.find_record(name)
+    if record:
+        book.delete_record(record.name.value)
+        return Fore.GREEN + f'Contact {record.name.value} was deleted' + Style.RESET_ALL
     raise KeyError  # 'Contact not found'
 
 
@@ -675,7 +2837,7 @@ def remove_email(book, name):
             record.remove_email()
             return Fore.GREEN + f"Email removed for contact {name}" + Style.RESET_ALL
         except ValueError as e:
-            return Fore.YELLOW + f"Warning: {e}" + Style.RESET_ALL
+            return command_failed(Fore.YELLOW + f"Warning: {e}" + Style.RESET_ALL)
     raise KeyError("Contact not found")
 
 
@@ -687,42 +2849,59 @@ def show_birthday(book, name):
     record = book.find_record(name)
     if record and record.birthday:
         return f"{record.name.value}'s birthday is {record.birthday}"
+    if record is None:
+        return command_failed(Fore.YELLOW + 'Contact not found' + Style.RESET_ALL
+                              + did_you_mean(book, name))
     return 'Birthday is not set for this contact'
 
 
-def upcoming_birthday(book):
+@exception_handler
+def upcoming_birthday(book, days=7):
     """
-    Displays a list of contacts with upcoming birthdays within the next 7 days.
+    Displays a list of contacts with upcoming birthdays within the next `days` days.
     Returns a message if no upcoming birthdays are found.
     """
-    list_bday = book.upcoming_birthday()
-    if not list_bday:
-        return 'No upcoming birthday in the next week'
+    days = int(days)
+    if days < 0:
+        raise ValueError('Number of days must not be negative')
     today = datetime.now().date()
+    list_bday = book.upcoming_birthday(days, today)
+    if not list_bday:
+        return f'No upcoming birthday in the next {days} days'
     lines = []
     for record in list_bday:
-        bday_this_year = record.birthday.value.replace(year=today.year)
-        if bday_this_year < today:
-            bday_this_year = record.birthday.value.replace(year=today.year + 1)
-        days_left = (bday_this_year - today).days
+        days_left = (next_birthday(record.birthday.value, today) - today).days
         lines.append(
             f'{record.name.value}: {record.birthday} (in {days_left} days)')
     return '\n'.join(lines)
 
 
-def search_notes(book, query):
+@exception_handler
+def search_notes(book, query, limit=None, offset=0):
     '''
-    search for contacts with tags
+    search for contacts by the words of their notes and tags, best match first.
+    Words are compared without case, accents or endings ('Meetings' finds
+    'meeting'); a query with no indexed word falls back to a substring search
     '''
-    results = []
-    for record in book.data.values():
-        note_text = record.note.lower()
-        tag_list = [t.lower() for t in record.tags]
-        if query.lower() in note_text or query.lower() in ' '.join(tag_list):
-            results.append(record)
-
-    if results:
-        return '\n'.join(str(r) for r in results)
+    def ranked(start):
+        # Ranks one record past the page, so paginate can tell whether more follow
+        count = None if limit is None else start + int(limit) + 1
+        return iter(book.search_notes(query, count)[start:])
+    page = paginate(ranked, limit, offset)
+    if page:
+        return page
+    if book.search_notes(query, 1):  # Paged past the last ranked match
+        return Fore.YELLOW + 'No tags found matching your query' + Style.RESET_ALL
+    query = query.lower()
+    if PARALLEL_SCAN is not None and PARALLEL_SCAN.applies(book):
+        results = PARALLEL_SCAN.search(book, query, 'notes')
+    else:
+        results = (record for record in book.iter_records()
+                   if query in record.note.lower()
+                   or query in ' '.join(record.get_tags()).lower())
+    page = paginate(results, limit, offset)
+    if page:
+        return page
     return Fore.YELLOW + 'No tags found matching your query' + Style.RESET_ALL
 
 
@@ -734,7 +2913,8 @@ def add_tags(book, name, *tags):
     record = book.find_record(name)
     if not record:
         raise KeyError
-    record.add_tags(*tags)
+    for tag in tags:
+        record.add_tag(tag)
     return Fore.GREEN + f"Tags added to {name}: {', '.join(tags)}" + Style.RESET_ALL
 
 
@@ -746,68 +2926,846 @@ def remove_tags(book, name, tag):
     record = book.find_record(name)
     if not record:
         raise KeyError
-    if tag.lower() not in record.tags:
-        return Fore.YELLOW + f"Tag '{tag}' not found for {name}" + Style.RESET_ALL
+    if not record.has_tag(tag):
+        return command_failed(Fore.YELLOW + f"Tag '{tag}' not found for {name}" + Style.RESET_ALL)
     record.remove_tag(tag)
     return Fore.GREEN + f"Tag '{tag}' removed form {name}" + Style.RESET_ALL
 
 
-@exception_handler
-def show_tags(book, name):
-    record = book.find_record(name)
-    if not record:
-        raise KeyError
-    return f"Tags for {name}: {record.show_tags()}"
-
-
-@exception_handler
-def search_by_tag(book, tag):
-    tag = tag.lower()
-    result = [r for r in book.data.values() if tag in r.tags]
-    if result:
-        return "\n".join(str(r) for r in result)
-    return Fore.YELLOW + f"No contacts found with tag '{tag}'"
-
-
 def sort_notes_by_tags(book):
     '''
     Sorts notes by tags, displaying a list of contacts grouped by tegs
     '''
-    tag_dict = {}
-    for record in book.data.values():
-        for tag in record.tags:
-            tag_dict.setdefault(tag, []).append(record)
-
-    if not tag_dict:
+    tags = book.get_all_tags()
+    if not tags:
         return Fore.YELLOW + "No tags found in the notebook" + Style.RESET_ALL
 
     output = []
-    for tag in sorted(tag_dict):
+    for tag in tags:
         output.append(Fore.BLUE + f"\nTag: #{tag}" + Style.RESET_ALL)
-        for record in tag_dict[tag]:
+        for record in book.search_by_tag(tag):
             note = record.note if record else "No note"
             output.append(f"- {record.name.value}: {note}")
     return '\n'.join(output)
 # ============ Added functions of saving and personalization`` ==================================
 
 
+class Journal:
+    """
+    Append-only log of the changes made since the last snapshot.
+    Each entry is a pickled ('put', record) or ('del', name) tuple, so
+    persisting a change costs O(change) instead of rewriting the whole book.
+    """
+
+    def __init__(self, snapshot, compact_every=1000):
+        import threading
+        self.snapshot = snapshot
+        self.filename = snapshot + '.journal'
+        # Entries being folded into the snapshot by a checkpoint
+        self.rotated = self.filename + '.old'
+        self.compact_every = compact_every
+        self.entries = 0
+        self.dirty = set()  # names of the contacts changed since the last snapshot
+        self.oldest = None  # time.monotonic() of the oldest change not in the snapshot
+        self.lock = threading.Lock()  # Guards the log file and the counters
+        self.saving = threading.Lock()  # Held while a snapshot is written
+        self._file = None
+
+    def replay(self, book):
+        """
+        Applies the logged changes to the book, including the entries of
+        a checkpoint that did not finish.
+        A torn entry left by a crash is cut off so new entries stay readable.
+        """
+        for filename in (self.rotated, self.filename):
+            try:
+                f = open(filename, 'r+b')
+            except FileNotFoundError:
+                continue
+            with f:
+                good = 0
+                while True:
+                    try:
+                        op, arg = book_unpickler()(f).load()
+                    except EOFError:
+                        break
+                    except Exception:
+                        f.truncate(good)
+                        break
+                    if op == 'put':
+                        book.add_record(arg)
+                    elif op == 'del':
+                        book.delete_record(arg)
+                    good = f.tell()
+                    self._count(op, arg)
+
+    def _count(self, op, arg):
+        self.entries += 1
+        self.dirty.add(arg.name.value if op == 'put' else arg)
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    def append(self, op, arg):
+        """Writes one entry and flushes it to the OS."""
+        import pickle
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.filename, 'ab')
+            pickle.dump((op, arg), self._file, pickle.HIGHEST_PROTOCOL)
+            self._file.flush()
+            self._count(op, arg)
+
+    def rotate(self):
+        """
+        Moves the logged entries aside for a checkpoint and starts an empty
+        log. Returns what restore() needs if the checkpoint fails.
+        Called with the lock held.
+        """
+        self.close()
+        if os.path.exists(self.rotated):
+            # An earlier checkpoint failed: keep its entries first
+            import shutil
+            if os.path.exists(self.filename):
+                with open(self.rotated, 'ab') as target, open(self.filename, 'rb') as source:
+                    shutil.copyfileobj(source, target)
+                os.remove(self.filename)
+        elif os.path.exists(self.filename):
+            os.replace(self.filename, self.rotated)
+        pending = (self.entries, self.dirty, self.oldest)
+        self.entries, self.dirty, self.oldest = 0, set(), None
+        return pending
+
+    def restore(self, pending):
+        """Counts the rotated entries as unsaved again after a failed checkpoint."""
+        entries, dirty, oldest = pending
+        with self.lock:
+            self.entries += entries
+            self.dirty |= dirty
+            if oldest is not None:
+                self.oldest = oldest if self.oldest is None else min(oldest, self.oldest)
+
+    def drop_rotated(self):
+        """Deletes the rotated entries once the snapshot holds them."""
+        try:
+            os.remove(self.rotated)
+        except FileNotFoundError:
+            pass
+
+    def truncate(self):
+        """Empties the log once its changes are part of a snapshot."""
+        with self.lock:
+            self.close()
+            open(self.filename, 'wb').close()
+            self.drop_rotated()
+            self.entries, self.dirty, self.oldest = 0, set(), None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@functools.cache
+def book_unpickler():
+    """
+    Returns the Unpickler class for address book files. It also loads files
+    saved by older versions run as a script (module __main__).
+    """
+    import pickle
+
+    class BookUnpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            if module == '__main__':
+                module = __name__
+            return super().find_class(module, name)
+
+    return BookUnpickler
+
+
+# File extensions that select the SQLite backend in load_data
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+# Snapshots start with this magic, the codec and the level; older ones are plain pickles
+SNAPSHOT_MAGIC = b'ABSNAP'
+# ...and end with the CRC32 and length of the stored (compressed) pickle
+SNAPSHOT_TRAILER = struct.Struct('<IQ')
+# Codec name -> (code stored in the header, levels it accepts, default level)
+SNAPSHOT_CODECS = {'none': (0, range(1), 0), 'zlib': (1, range(10), 6), 'lzma': (2, range(10), 6)}
+# How save_data compresses snapshots: (codec, level); set by --compress
+SNAPSHOT_COMPRESSION = ('zlib', 1)
+
+
+# Function to parse a --compress value: 'none', 'zlib', 'zlib:9', 'lzma:0', ...
+def parse_compression(text):
+    codec, _, level = text.lower().partition(':')
+    if codec not in SNAPSHOT_CODECS:
+        raise ValueError(f'Unknown compression {codec}, use {", ".join(SNAPSHOT_CODECS)}')
+    _, levels, default = SNAPSHOT_CODECS[codec]
+    level = int(level) if level else default
+    if level not in levels:
+        raise ValueError(f'{codec} levels are {levels[0]} to {levels[-1]}')
+    return codec, level
+
+
+class SnapshotWriter:
+    """
+    File-like object that pickle writes a snapshot into. Data is compressed
+    on the way and the CRC32 of the stored bytes is kept for the trailer.
+    """
+
+    def __init__(self, f, codec, level):
+        self._file = f
+        self._compressor = None
+        if codec == 'zlib':
+            import zlib
+            self._compressor = zlib.compressobj(level)
+        elif codec == 'lzma':
+            import lzma
+            self._compressor = lzma.LZMACompressor(preset=level)
+        self.checksum = 0
+        self.length = 0
+
+    def write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._store(data)
+
+    def _store(self, data):
+        import zlib
+        if data:
+            self.checksum = zlib.crc32(data, self.checksum)
+            self.length += len(data)
+            self._file.write(data)
+
+    def close(self):
+        """Flushes the compressor; the trailer can be written after this."""
+        if self._compressor is not None:
+            self._store(self._compressor.flush())
+
+
+# Function returning an opener for the pickle stored in a snapshot: a buffered
+# stream that decompresses as pickle reads. Defined on first use, like book_unpickler.
+@functools.cache
+def snapshot_reader():
+    import io
+
+    class SnapshotReader(io.RawIOBase):
+        """Decompresses `length` stored bytes of a snapshot as they are read."""
+
+        def __init__(self, f, codec, length):
+            self._file = f
+            self._left = length
+            self._decompressor = None
+            if codec == 'zlib':
+                import zlib
+                self._decompressor = zlib.decompressobj()
+            elif codec == 'lzma':
+                import lzma
+                self._decompressor = lzma.LZMADecompressor()
+            self._buffer = memoryview(b'')
+
+        def readable(self):
+            return True
+
+        def readinto(self, target):
+            while not self._buffer:
+                if not self._left:
+                    return 0
+                chunk = self._file.read(min(self._left, 1 << 16))
+                if not chunk:
+                    raise EOFError('Snapshot is truncated')
+                self._left -= len(chunk)
+                if self._decompressor is not None:
+                    chunk = self._decompressor.decompress(chunk)
+                self._buffer = memoryview(chunk)
+            count = min(len(target), len(self._buffer))
+            target[:count] = self._buffer[:count]
+            self._buffer = self._buffer[count:]
+            return count
+
+    return lambda f, codec, length: io.BufferedReader(SnapshotReader(f, codec, length), 1 << 16)
+
+
+def write_snapshot(book, filename, compression=None):
+    """
+    Pickles the book, compressed with `compression` (codec, level; by default
+    SNAPSHOT_COMPRESSION) and followed by a checksum, to a temporary file,
+    and renames it over `filename`. The snapshot it replaces is kept as
+    `filename.prev`, so a crash leaves either the old snapshot or the new one
+    and a damaged snapshot still has a previous generation to fall back to.
+    """
+    import pickle
+    codec, level = compression or SNAPSHOT_COMPRESSION
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + bytes([SNAPSHOT_CODECS[codec][0], level]))
+        writer = SnapshotWriter(f, codec, level)
+        pickle.dump(book, writer, pickle.HIGHEST_PROTOCOL)
+        writer.close()
+        f.write(SNAPSHOT_TRAILER.pack(writer.checksum, writer.length))
+        f.flush()
+        os.fsync(f.fileno())
+    install_snapshot(tmp, filename)
+
+
+# Function to rename a finished temporary snapshot over `filename`,
+# keeping the snapshot it replaces as `filename.prev`
+def install_snapshot(tmp, filename):
+    if os.path.exists(filename):
+        os.replace(filename, filename + '.prev')
+    os.replace(tmp, filename)
+
+
+def read_snapshot(filename):
+    """
+    Loads a snapshot written by write_snapshot, or a plain pickle written
+    by older versions. Raises ValueError if the checksum does not match.
+    """
+    import zlib
+    with open(filename, 'rb') as f:
+        header = f.read(len(SNAPSHOT_MAGIC) + 2)
+        if not header.startswith(SNAPSHOT_MAGIC):
+            f.seek(0)
+            return book_unpickler()(f).load()
+        codec = next((name for name, (code, *_) in SNAPSHOT_CODECS.items()
+                      if code == header[-2]), None)
+        if codec is None:
+            raise ValueError('unknown compression')
+        size = f.seek(0, os.SEEK_END)
+        if size < len(header) + SNAPSHOT_TRAILER.size:
+            raise ValueError('the file is truncated')
+        f.seek(size - SNAPSHOT_TRAILER.size)
+        checksum, length = SNAPSHOT_TRAILER.unpack(f.read(SNAPSHOT_TRAILER.size))
+        if length != size - len(header) - SNAPSHOT_TRAILER.size:
+            raise ValueError('the file is truncated')
+        f.seek(len(header))
+        crc, left = 0, length
+        while left:
+            chunk = f.read(min(left, 1 << 20))
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            left -= len(chunk)
+        if crc != checksum:
+            raise ValueError('the file is damaged (checksum mismatch)')
+        f.seek(len(header))
+        return book_unpickler()(snapshot_reader()(f, codec, length)).load()
+
+
 def save_data(book, filename='addressbook.pkl'):
-    with open(filename, 'wb') as f:
-        pickle.dump(book, f)
+    """Writes a full snapshot of the book and compacts its journal."""
+    if isinstance(book, SQLiteAddressBook):
+        book.commit()  # Everything else is already in the database
+        return
+    journal = book.journal
+    compacts = journal is not None and journal.snapshot == filename
+    # Wait for a background checkpoint, so it cannot replace this snapshot
+    with journal.saving if compacts else nullcontext():
+        if isinstance(book, ColumnarAddressBook):
+            book.save(filename)
+        else:
+            write_snapshot(book, filename)
+        if compacts:
+            journal.truncate()
+
+
+def load_snapshot(filename):
+    """
+    Reads the snapshot, falling back to the previous generation
+    (`filename.prev`) when it is missing or damaged. Returns an empty book
+    if neither exists; raises ValueError if they exist but cannot be read.
+    """
+    errors = []
+    for candidate in (filename, filename + '.prev'):
+        try:
+            book = read_snapshot(candidate)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            errors.append(f'{candidate}: {e}')
+            continue
+        if errors:
+            # The journal only holds the changes made after the damaged snapshot
+            print(Fore.YELLOW + f'Warning: {errors[0]}; loaded the previous snapshot, '
+                  'changes saved since then may be missing' + Style.RESET_ALL, file=sys.stderr)
+        return book
+    if errors:
+        raise ValueError('Cannot load the address book: ' + '; '.join(errors))
+    return AddressBook()
 
 
 def load_data(filename='addressbook.pkl'):
+    """
+    Loads the last snapshot, replays the journal tail and starts journaling.
+    A .db/.sqlite file is opened as an SQLiteAddressBook instead, and an
+    .abk columnar snapshot is memory-mapped as a ColumnarAddressBook.
+    """
+    if filename.lower().endswith(SQLITE_EXTENSIONS):
+        return SQLiteAddressBook(filename)
+    if filename.lower().endswith(COLUMNAR_EXTENSIONS):
+        book = ColumnarAddressBook(filename)
+    else:
+        book = load_snapshot(filename)
+    journal = Journal(filename)
+    journal.replay(book)
+    book.journal = journal
+    return book
+
+
+def close_data(book):
+    """Closes the journal; every change is already on disk at this point."""
+    global AUTOSAVE
+    if AUTOSAVE is not None and AUTOSAVE.book is book:
+        AUTOSAVE.stop()
+        AUTOSAVE = None
+    if book.journal is not None:
+        book.journal.close()
+    if isinstance(book, (SQLiteAddressBook, ColumnarAddressBook)):
+        book.close()
+
+
+def convert_data(source, target):
+    """
+    Copies the book in `source` to `target`, in the format given by the
+    target's extension (.pkl, .db/.sqlite or .abk). Returns the number of contacts.
+    """
+    book = load_data(source)
     try:
-        with open(filename, 'rb') as f:
-            return pickle.load(f)
-    except FileNotFoundError:
-        return AddressBook()
+        records = sorted(book.iter_records(), key=lambda record: record.name.value)
+        if target.lower().endswith(COLUMNAR_EXTENSIONS):
+            write_columnar(target, lambda: (functools.partial(record_column, record)
+                                            for record in records))
+        elif target.lower().endswith(SQLITE_EXTENSIONS):
+            copy = SQLiteAddressBook(target)
+            copy.add_records(records)
+            copy.close()
+        else:
+            copy = AddressBook()
+            copy.add_records(records)
+            save_data(copy, target)
+    finally:
+        close_data(book)
+    return len(records)
+
+
+class Autosave:
+    """
+    Background checkpoints for an in-memory book.
+    Every change is journaled as it happens; this thread folds the journal
+    into a new snapshot every `interval` seconds or after `max_changes`
+    changes, so the journal stays short and neither the prompt nor exit
+    waits for a full save. The snapshot is written to a temporary file
+    and renamed into place. Each checkpoint pickles the whole book while
+    holding the GIL; the journal is what makes single changes cheap.
+    """
+
+    def __init__(self, book, interval=30, max_changes=1000):
+        import threading
+        self.book = book
+        self.interval = interval
+        self.max_changes = max_changes
+        self.last_checkpoint = None  # time.time() of the last checkpoint
+        self.last_duration = None
+        self.error = None  # Exception of the last failed checkpoint
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread, letting a checkpoint in progress finish."""
+        self._stop.set()
+        self._thread.join()
+
+    def lag(self):
+        """Returns (contacts changed since the last checkpoint, age in seconds of the oldest change)."""
+        journal = self.book.journal
+        if journal is None or journal.oldest is None:
+            return 0, 0.0
+        return len(journal.dirty), time.monotonic() - journal.oldest
+
+    def _due(self):
+        journal = self.book.journal
+        if journal is None or journal.oldest is None:
+            return False
+        return (journal.entries >= self.max_changes
+                or time.monotonic() - journal.oldest >= self.interval)
+
+    def _run(self):
+        while not self._stop.wait(min(1.0, self.interval)):
+            if self._due():
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    self.error = e  # The changes are still in the journal
+
+    def checkpoint(self):
+        """Writes the changes logged so far into the snapshot."""
+        journal = self.book.journal
+        if journal is None:
+            return  # A batch is running and saves the book itself
+        started = time.monotonic()
+        with journal.saving:
+            with journal.lock:
+                if self.book.journal is not journal:
+                    return
+                pending = journal.rotate()
+                data = dict(self.book.data)  # Changes made from now on go to the new log
+            frozen = AddressBook.__new__(AddressBook)
+            frozen.data = data
+            try:
+                write_snapshot(frozen, journal.snapshot)
+            except Exception:
+                journal.restore(pending)
+                raise
+            journal.drop_rotated()
+        self.last_duration = time.monotonic() - started
+        self.last_checkpoint = time.time()
+        self.error = None
+
+    def status(self):
+        """Describes how far the snapshot is behind the book."""
+        changed, age = self.lag()
+        if changed:
+            text = (f'{changed} contact(s) changed in the last {age:.0f} s are in the journal '
+                    f'but not yet in the snapshot')
+        else:
+            text = 'The snapshot is up to date'
+        if self.last_checkpoint is not None:
+            text += (f'. Last checkpoint at {datetime.fromtimestamp(self.last_checkpoint):%H:%M:%S}'
+                     f' took {self.last_duration:.2f} s')
+        if self.error is not None:
+            return Fore.RED + f'{text}. Last checkpoint failed: {self.error}' + Style.RESET_ALL
+        return text
+
+
+# Background checkpoints of the loaded book, or None when off
+AUTOSAVE = None
+
+
+def start_autosave(book, interval=30, max_changes=1000):
+    """Starts background checkpoints for an in-memory book (interval 0: off)."""
+    global AUTOSAVE
+    if interval and isinstance(book, AddressBook) and book.journal is not None:
+        AUTOSAVE = Autosave(book, interval, max_changes).start()
+
+
+# Function to show how far the saved snapshot is behind
+def autosave_status():
+    if AUTOSAVE is None:
+        return Fore.YELLOW + 'No background checkpoints are running; changes are saved in the journal' + Style.RESET_ALL
+    return AUTOSAVE.status()
+
+
+# ============ Import and export ==================================
+
+# Columns of the CSV format; phones and tags are separated by ';'
+CSV_FIELDS = ('name', 'phones', 'birthday', 'email', 'address', 'note', 'tags')
+
+
+# Function to drop the separators people put into phone numbers
+def normalize_phone(value):
+    return re.sub(r'[\s().+-]', '', value)
+
+
+def record_from_fields(fields):
+    """
+    Builds a validated Record from a dict with the CSV_FIELDS keys.
+    Raises ValueError for the first invalid field.
+    """
+    name = (fields.get('name') or '').strip()
+    if not name:
+        raise ValueError('Name is required')
+    record = Record(name)
+    for phone in fields.get('phones') or ():
+        record.add_phone(normalize_phone(phone))
+    if fields.get('birthday'):
+        record.add_birthday(fields['birthday'].strip())
+    if fields.get('email'):
+        record.set_email(fields['email'].strip())
+    if fields.get('address'):
+        record.set_address(fields['address'].strip())
+    if fields.get('note'):
+        record.add_note(fields['note'])
+    for tag in fields.get('tags') or ():
+        record.add_tag(tag)
+    return record
+
+
+def read_csv(f):
+    """Yields (line number, fields) for every row of a CSV file."""
+    import csv
+    reader = csv.DictReader(f)
+    if not reader.fieldnames or 'name' not in reader.fieldnames:
+        raise ValueError("CSV file needs a 'name' column")
+    for row in reader:
+        fields = dict(row)
+        for key in ('phones', 'tags'):
+            fields[key] = [v.strip() for v in (row.get(key) or '').split(';') if v.strip()]
+        yield reader.line_num, fields
+
+
+def write_csv(f, records):
+    """Writes records as CSV rows one at a time."""
+    import csv
+    writer = csv.writer(f)
+    writer.writerow(CSV_FIELDS)
+    for record in records:
+        writer.writerow([
+            record.name.value,
+            ';'.join(phone.value for phone in record.phones),
+            str(record.birthday) if record.birthday else '',
+            record.email.value if record.email else '',
+            record.address or '',
+            record.note,
+            ';'.join(record.get_tags()),
+        ])
+
+
+# Functions to escape and unescape vCard text values
+def vcard_escape(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def vcard_unescape(value):
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def read_vcard(f):
+    """
+    Yields (line number, fields) for every card of a vCard file.
+    Folded lines are joined; unknown properties are ignored.
+    """
+    def unfolded():
+        previous, start = None, 0
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if line[:1] in (' ', '\t') and previous is not None:
+                previous += line[1:]
+                continue
+            if previous is not None:
+                yield start, previous
+            previous, start = line, number
+        if previous is not None:
+            yield start, previous
+
+    fields, first_line = None, 0
+    for number, line in unfolded():
+        key, _, value = line.partition(':')
+        prop = key.split(';')[0].upper()
+        if prop == 'BEGIN' and value.upper() == 'VCARD':
+            fields, first_line = {'phones': [], 'tags': []}, number
+        elif fields is None:
+            continue
+        elif prop == 'END':
+            yield first_line, fields
+            fields = None
+        elif prop == 'FN':
+            fields['name'] = vcard_unescape(value)
+        elif prop == 'TEL':
+            # vCard 4 may write phones as tel: URIs
+            fields['phones'].append(value[4:] if value.lower().startswith('tel:') else value)
+        elif prop == 'EMAIL':
+            fields['email'] = value
+        elif prop == 'BDAY':
+            digits = value.replace('-', '')
+            if len(digits) == 8 and digits.isdigit():
+                value = f'{digits[6:8]}.{digits[4:6]}.{digits[:4]}'
+            fields['birthday'] = value
+        elif prop == 'ADR':
+            parts = [vcard_unescape(p) for p in re.split(r'(?<!\\);', value)]
+            fields['address'] = ', '.join(p for p in parts if p)
+        elif prop == 'NOTE':
+            fields['note'] = vcard_unescape(value)
+        elif prop == 'CATEGORIES':
+            fields['tags'].extend(vcard_unescape(t) for t in re.split(r'(?<!\\),', value) if t)
+
+
+def write_vcard(f, records):
+    """Writes records as vCard 3.0 cards one at a time."""
+    for record in records:
+        lines = ['BEGIN:VCARD', 'VERSION:3.0', f'FN:{vcard_escape(record.name.value)}']
+        lines.extend(f'TEL:{phone.value}' for phone in record.phones)
+        if record.email:
+            lines.append(f'EMAIL:{record.email.value}')
+        if record.birthday:
+            lines.append(f'BDAY:{record.birthday.value.isoformat()}')
+        if record.address:
+            lines.append(f'ADR:;;{vcard_escape(record.address)};;;;')
+        if record.note:
+            lines.append(f'NOTE:{vcard_escape(record.note)}')
+        if record.tags:
+            lines.append('CATEGORIES:' + ','.join(vcard_escape(t) for t in record.get_tags()))
+        lines.append('END:VCARD')
+        f.write('\r\n'.join(lines) + '\r\n')
+
+
+# File extension -> (reader, writer)
+FILE_FORMATS = {
+    '.csv': (read_csv, write_csv),
+    '.vcf': (read_vcard, write_vcard),
+    '.vcard': (read_vcard, write_vcard),
+}
+
+
+def file_format(filename):
+    """Returns the (reader, writer) pair for the file extension."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FILE_FORMATS:
+        raise ValueError('Unknown file format, use .csv or .vcf')
+    return FILE_FORMATS[extension]
+
+
+def import_contacts(book, filename, chunk_size=1000):
+    """
+    Streams contacts from a CSV or vCard file into the book.
+    Rows are validated into Records and added a chunk at a time, so memory
+    stays bounded and indexes are updated in bulk. Invalid rows are skipped.
+    Returns (number imported, list of (line number, error message)).
+    """
+    reader = file_format(filename)[0]
+    imported, errors, chunk = 0, [], []
+    with open(filename, newline='', encoding='utf-8') as f:
+        for line, fields in reader(f):
+            try:
+                record = record_from_fields(fields)
+                for phone in record.phones:
+                    book.check_phone(phone.value, record.name.value)
+                if record.email:
+                    book.check_email(record.email.value, record.name.value)
+            except ValueError as e:
+                errors.append((line, str(e)))
+                continue
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                imported += book.add_records(chunk)
+                chunk = []
+    imported += book.add_records(chunk)
+    return imported, errors
+
+
+def export_contacts(book, filename):
+    """Streams every contact of the book to a CSV or vCard file. Returns the count."""
+    writer = file_format(filename)[1]
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in book.iter_records():
+            count += 1
+            yield record
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer(f, counted())
+    return count
 
 
-def guess_command(user_input, known_commands, threshold=0.8):
+@exception_handler
+def import_file(book, filename):
+    """
+    Imports contacts from a .csv or .vcf file.
+    Reports how many were imported and the first rows that failed validation.
+    """
+    imported, errors = import_contacts(book, filename)
+    message = Fore.GREEN + f'Imported {imported} contacts from {filename}' + Style.RESET_ALL
+    if errors:
+        message += '\n' + Fore.YELLOW + f'{len(errors)} rows skipped:' + Style.RESET_ALL
+        message += ''.join(f'\n  line {line}: {error}' for line, error in errors[:10])
+        if len(errors) > 10:
+            message += f'\n  ... and {len(errors) - 10} more'
+    return message
+
+
+@exception_handler
+def export_file(book, filename):
+    """Exports all contacts to a .csv or .vcf file."""
+    count = export_contacts(book, filename)
+    return Fore.GREEN + f'Exported {count} contacts to {filename}' + Style.RESET_ALL
+
+
+# Function to list the strings left after deleting up to `depth` characters
+def deletions(word, depth):
+    variants = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+# Function to compute the edit distance with adjacent transpositions
+def edit_distance(a, b):
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class CommandMatcher:
+    """
+    Fuzzy command lookup, built once at startup.
+    A prefix table (a flattened trie) answers completions and a
+    symmetric-delete table answers typos, so resolving input costs the
+    same no matter how many commands and aliases are registered.
+    """
+
+    def __init__(self, names, max_distance=2):
+        self.names = list(dict.fromkeys(names))
+        self.max_distance = max_distance
+        self._known = set(self.names)
+        self._longest = max(map(len, self.names), default=0)
+        self._prefixes = {}  # prefix -> commands starting with it
+        self._deletes = {}  # command with characters deleted -> commands
+        for name in self.names:
+            for i in range(1, len(name)):
+                self._prefixes.setdefault(name[:i], []).append(name)
+            for variant in deletions(name, max_distance):
+                self._deletes.setdefault(variant, set()).add(name)
+
+    def allowed_distance(self, word):
+        """Short words tolerate one typo, longer ones two."""
+        return min(1 if len(word) <= 4 else 2, self.max_distance)
+
+    def match(self, word):
+        """
+        Returns (candidates, is_confident).
+        Candidates are ordered by edit distance, then by prefix completions.
+        """
+        if word in self._known:
+            return [word], True
+        distance = self.allowed_distance(word)
+        typos = {}
+        if len(word) <= self._longest + distance:
+            for variant in deletions(word, distance):
+                for name in self._deletes.get(variant, ()):
+                    if name not in typos:
+                        typos[name] = edit_distance(word, name)
+        close = sorted((d, name) for name, d in typos.items() if d <= distance)
+        candidates = [name for _, name in close]
+        for name in self._prefixes.get(word, ()):
+            if name not in typos or typos[name] > distance:
+                candidates.append(name)
+        # A single candidate one typo away is applied without asking
+        is_confident = len(candidates) == 1 and close and close[0][0] == 1
+        return candidates, bool(is_confident)
+
+
+def guess_command(user_input, matcher=None):
     """
     Returns the most similar command and list of arguments.
-    If similarity ≥ threshold, the command is applied automatically.
+    A single close match is applied automatically, otherwise
+    the candidates are returned for user confirmation.
     """
     tokens = user_input.strip().split()
     if not tokens:
@@ -816,29 +3774,19 @@ def guess_command(user_input, known_commands, threshold=0.8):
     input_cmd = tokens[0].lower()
     args = tokens[1:]
 
-    # Exact match
-    if input_cmd in known_commands:
-        return input_cmd, args, True
-
-    # Fuzzy matching for similar commands
-    matches = []
-    for cmd in known_commands:
-        ratio = difflib.SequenceMatcher(None, input_cmd, cmd).ratio()
-        if ratio >= threshold:
-            matches.append((cmd, ratio))
+    if matcher is None:
+        if input_cmd in COMMANDS_BY_NAME:
+            return input_cmd, args, True
+        matcher = command_matcher()
+    candidates, is_confident = matcher.match(input_cmd)
+    if not candidates:
+        # No matches found
+        return None, args, False
+    if is_confident:
+        return candidates[0], args, True
+    # Otherwise, return the top matches for user confirmation
+    return candidates, args, False
 
-    # Sort matches by similarity (highest first)
-    matches.sort(key=lambda x: x[1], reverse=True)
-
-    if matches:
-        # If there's only one confident match and it's above a stricter threshold
-        if len(matches) == 1 and matches[0][1] >= 0.9:
-            return matches[0][0], args, True
-        # Otherwise, return the top matches for user confirmation
-        return [match[0] for match in matches], args, False
-
-    # No matches found
-    return None, args, False
 
 @exception_handler
 def add_tag(book, name, tag):
@@ -866,15 +3814,27 @@ def show_tags(book, name):
         if tags:
             return f'Tags of contact {name}\'s note: {", ".join(tags)}'
         return Fore.YELLOW + 'Note has no tags' + Style.RESET_ALL
-    return Fore.YELLOW + 'Contact not found' + Style.RESET_ALL
+    return command_failed(Fore.YELLOW + 'Contact not found' + Style.RESET_ALL
+                          + did_you_mean(book, name))
 
-def search_by_tag(book, tag):
+@exception_handler
+def search_by_tag(book, tag, limit=None, offset=0):
     """Search for contacts by tag"""
-    results = book.search_by_tag(tag)
-    if results:
-        return "\n".join(str(record) for record in results)
+    page = paginate(iter(book.search_by_tag(tag)), limit, offset)
+    if page:
+        return page
     return Fore.YELLOW + f'Contacts with tag "{tag}" not found' + Style.RESET_ALL
 
+
+@exception_handler
+def search_by_tag_query(book, *words):
+    """Search for contacts by a tag expression: work AND (kyiv OR lviv) NOT archived"""
+    query = ' '.join(words)
+    page = paginate(iter(book.search_by_tags(query)))
+    if page:
+        return page
+    return Fore.YELLOW + f'No contacts match "{query}"' + Style.RESET_ALL
+
 def show_all_tags(book):
     """Shows all unique tags"""
     tags = book.get_all_tags()
@@ -882,36 +3842,549 @@ def show_all_tags(book):
         return f'All tags: {", ".join(tags)}'
     return Fore.YELLOW + 'Tags not found' + Style.RESET_ALL
 
-def main():
-    # book = AddressBook()
-    book = load_data()  # Download at the start
-
-    # List of known commands supported by the bot
-    known_commands = [
-        "hello",
-        "add", "search",
-        "edit-name", 
-        "add-note", "edit-note", "remove-note","show-note",
-        "add-tag", "remove-tag", "show-tags", "search-tag", "all-tags",
-        "all", 
-        "delete", 
-        "add-birthday", "show-birthday",
-        "add-email", "edit-email", "remove-email",
-        "add-address", "edit-address", "remove-address",
-        "birthdays",
-        "edit-phone", "remove-phone",
-        "phone",
-        "exit", "close"
-    ]
+
+@exception_handler
+def add_email(book, name, email):
+    """
+    Sets the email address of an existing contact.
+    Returns an error message if the contact is not found or the email is invalid.
+    """
+    record = book.find_record(name)
+    if not record:
+        return command_failed(Fore.RED + f"Contact {name} not found" + Style.RESET_ALL
+                              + did_you_mean(book, name))
+    try:
+        warning = book.check_email(email, record.name.value)
+        record.set_email(email)
+    except ValueError as e:
+        return command_failed(Fore.RED + f"Error: {e}" + Style.RESET_ALL)
+    message = Fore.GREEN + f"Email {email} added to contact {name}" + Style.RESET_ALL
+    if warning:
+        message += '\n' + Fore.YELLOW + f'Warning: {warning}' + Style.RESET_ALL
+    return message
+
+
+@exception_handler
+def edit_email(book, name, email):
+    """
+    Changes the email address of an existing contact.
+    Returns an error message if the contact is not found or the email is invalid.
+    """
+    record = book.find_record(name)
+    if not record:
+        return command_failed(Fore.RED + f"Contact {name} not found" + Style.RESET_ALL
+                              + did_you_mean(book, name))
+    try:
+        warning = book.check_email(email, record.name.value)
+        record.edit_email(email)
+    except ValueError as e:
+        return command_failed(Fore.RED + f"Error: {e}" + Style.RESET_ALL)
+    message = Fore.GREEN + f"Email {email} updated for contact {name}" + Style.RESET_ALL
+    if warning:
+        message += '\n' + Fore.YELLOW + f'Warning: {warning}' + Style.RESET_ALL
+    return message
+
+
+def who_has_email(book, email):
+    """
+    Shows which contacts have an email address (case does not matter).
+    Returns a message if nobody has it.
+    """
+    records = book.find_by_email(email)
+    if records:
+        names = ', '.join(record.name.value for record in records)
+        return f'Email {email} belongs to: {names}'
+    return Fore.YELLOW + f'Nobody has email {email}' + Style.RESET_ALL
+
+
+@exception_handler
+def search_by_domain(book, domain, limit=None, offset=0):
+    """Shows the contacts with an email address at the domain or one of its subdomains"""
+    page = paginate(iter(book.search_by_domain(domain)), limit, offset)
+    if page:
+        return page
+    return Fore.YELLOW + f'No contacts with an email at {domain}' + Style.RESET_ALL
+
+
+# ============ Command statistics ==================================
+
+
+class CommandStats:
+    """
+    Per-command call counts, error counts and latency histograms.
+    Latencies go into fixed buckets spaced 10% apart (1 µs to ~2 min), so
+    recording a call costs the same however long the session runs, and
+    percentiles are accurate to one bucket.
+    """
+
+    BOUNDS = tuple(1e-6 * 1.1 ** i for i in range(196))
+
+    def __init__(self):
+        import threading
+        self.commands = {}  # name -> [calls, errors, total seconds, histogram]
+        # Set by handlers when a command fails; per thread, as server mode
+        # runs commands in several worker threads at once
+        self._local = threading.local()
+        self._current = None
+        self._started = 0.0
+
+    @property
+    def failed(self):
+        return getattr(self._local, 'failed', False)
+
+    @failed.setter
+    def failed(self, value):
+        self._local.failed = value
+
+    def begin(self, name):
+        """Starts timing a command."""
+        self._current = name
+        self.failed = False
+        self._started = time.perf_counter()
+
+    def end(self):
+        """Stops timing the current command and records it."""
+        self.record(self._current, time.perf_counter() - self._started, self.failed)
+        self._current = None
+
+    def record(self, name, seconds, failed=False):
+        """Records one call of a command that took `seconds`."""
+        entry = self.commands.get(name)
+        if entry is None:
+            entry = self.commands[name] = [0, 0, 0.0, [0] * (len(self.BOUNDS) + 1)]
+        entry[0] += 1
+        entry[1] += failed
+        entry[2] += seconds
+        entry[3][bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+    def percentile(self, histogram, fraction):
+        """Returns the upper bound in seconds of the bucket holding the percentile."""
+        rank = fraction * sum(histogram)
+        seen = 0
+        for i, count in enumerate(histogram):
+            seen += count
+            if count and seen >= rank:
+                return self.BOUNDS[min(i, len(self.BOUNDS) - 1)]
+        return 0.0
+
+    def summary(self):
+        """Returns one dict per command, slowest total time first."""
+        rows = []
+        for name, (calls, errors, total, histogram) in self.commands.items():
+            rows.append({
+                'command': name, 'calls': calls, 'errors': errors,
+                'total_ms': total * 1000, 'mean_ms': total * 1000 / calls,
+                'p50_ms': self.percentile(histogram, 0.50) * 1000,
+                'p95_ms': self.percentile(histogram, 0.95) * 1000,
+                'p99_ms': self.percentile(histogram, 0.99) * 1000,
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def report(self):
+        """Formats the summary as a table."""
+        rows = self.summary()
+        if not rows:
+            return Fore.YELLOW + 'No commands timed yet' + Style.RESET_ALL
+        lines = [Fore.GREEN + f"{'command':<18}{'calls':>7}{'errors':>7}{'p50 ms':>10}"
+                 f"{'p95 ms':>10}{'p99 ms':>10}{'total ms':>11}" + Style.RESET_ALL]
+        for row in rows:
+            lines.append(f"{row['command']:<18}{row['calls']:>7}{row['errors']:>7}"
+                         f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+                         f"{row['p99_ms']:>10.3f}{row['total_ms']:>11.1f}")
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        """Writes the summary to a JSON file."""
+        import json
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+# Statistics of the current session, or None when timing is off.
+# Dispatch only checks this for None, so timing costs nothing when off.
+STATS = None
+
+
+# Function to show the command statistics of the session
+def show_stats():
+    if STATS is None:
+        return Fore.YELLOW + 'Command timing is off. Start the bot with --stats to turn it on.' + Style.RESET_ALL
+    return STATS.report()
+
+
+# Registry of the bot commands: how many arguments each one needs at least
+# and the handler that turns (book, args) into the text to print.
+# A command without a handler ends the session. Commands that do not use
+# the book run before it is loaded, and read-only commands may run
+# concurrently in server mode. Commands that read or write files named by
+# the user are refused in server mode, where the user is a network client.
+Command = namedtuple('Command',
+                     'name category description arity handler aliases uses_book read_only '
+                     'uses_files',
+                     defaults=((), True, False, False))
+
+COMMANDS = [
+    Command('hello', 'Main commands', 'Greeting', 0,
+            lambda book, args: 'Hello! How can I help you?' + Style.RESET_ALL,
+            uses_book=False, read_only=True),
+    Command('commands', 'Main commands', 'Show available commands', 0,
+            lambda book, args: commands_table(), uses_book=False, read_only=True),
+    Command('stats', 'Main commands', 'Show command timings', 0,
+            lambda book, args: show_stats(), uses_book=False, read_only=True),
+    Command('autosave', 'Main commands', 'Show unsaved changes', 0,
+            lambda book, args: autosave_status(), uses_book=False, read_only=True),
+    Command('exit', 'Main commands', 'Exit the program', 0, None,
+            aliases=('close',)),
+
+    Command('add', 'Contact management', 'Add contact', 2,
+            lambda book, args: add_contact(book, args[0], args[1])),
+    Command('edit-name', 'Contact management', "Edit a contact's name", 2,
+            lambda book, args: edit_name(book, args[0], args[1])),
+    Command('delete', 'Contact management', 'Delete a contact', 1,
+            lambda book, args: delete_contact(book, args[0])),
+    Command('search', 'Contact management', 'Search for a contact', 1,
+            lambda book, args: search_contacts(book, args[0], *args[1:3]),
+            read_only=True),
+    Command('complete', 'Contact management', 'Names starting with [limit]', 1,
+            lambda book, args: complete_name(book, args[0], *args[1:2]),
+            read_only=True),
+    Command('all', 'Contact management', 'Show all contacts [limit offset]', 0,
+            lambda book, args: show_all(book, *args[:2]),
+            read_only=True),
+    Command('import', 'Contact management', 'Import a .csv or .vcf file', 1,
+            lambda book, args: import_file(book, args[0]),
+            uses_files=True),
+    Command('export', 'Contact management', 'Export to a .csv or .vcf file', 1,
+            lambda book, args: export_file(book, args[0]),
+            read_only=True, uses_files=True),
+
+    Command('phone', 'Phone management', "Show a contact's phone", 1,
+            lambda book, args: show_phone(book, args[0]),
+            read_only=True),
+    Command('edit-phone', 'Phone management', 'Edit a phone', 3,
+            lambda book, args: change_contact(book, args[0], args[1], args[2])),
+    Command('remove-phone', 'Phone management', 'Remove a phone', 2,
+            lambda book, args: remove_phone(book, args[0], args[1])),
+    Command('who', 'Phone management', 'Find who owns a phone', 1,
+            lambda book, args: who_has_phone(book, args[0]),
+            read_only=True),
+
+    Command('add-address', 'Address management', 'Add address', 2,
+            lambda book, args: add_address(book, args[0], ' '.join(args[1:]))),
+    Command('edit-address', 'Address management', 'Edit address', 2,
+            lambda book, args: edit_address(book, args[0], ' '.join(args[1:]))),
+    Command('remove-address', 'Address management', 'Remove address', 1,
+            lambda book, args: remove_address(book, args[0])),
+
+    Command('add-note', 'Note management', 'Add a note', 2,
+            lambda book, args: add_note(book, args[0], ' '.join(args[1:]))),
+    Command('edit-note', 'Note management', 'Edit a note', 2,
+            lambda book, args: edit_note(book, args[0], ' '.join(args[1:]))),
+    Command('remove-note', 'Note management', 'Remove a note', 1,
+            lambda book, args: remove_note(book, args[0])),
+    Command('show-note', 'Note management', 'Show a note', 1,
+            lambda book, args: show_note(book, args[0]),
+            read_only=True),
+    Command('search-notes', 'Note management', 'Rank notes and tags by words', 1,
+            lambda book, args: search_notes(book, *query_and_page(args)),
+            read_only=True),
+
+    Command('add-tag', 'Tag management', 'Add tags to a note', 2,
+            lambda book, args: add_tags(book, args[0], *args[1:])),
+    Command('remove-tag', 'Tag management', 'Remove a tag from a note', 2,
+            lambda book, args: remove_tags(book, args[0], args[1])),
+    Command('show-tags', 'Tag management', 'Show all tags of a note', 1,
+            lambda book, args: show_tags(book, args[0]),
+            read_only=True),
+    Command('search-tag', 'Tag management', 'Search contacts by tag', 1,
+            lambda book, args: search_by_tag(book, args[0], *args[1:3]),
+            read_only=True),
+    Command('tags', 'Tag management', 'Search by AND / OR / NOT of tags', 1,
+            lambda book, args: search_by_tag_query(book, *args),
+            read_only=True),
+    Command('all-tags', 'Tag management', 'Show all unique tags', 0,
+            lambda book, args: show_all_tags(book),
+            read_only=True),
+    Command('sort-notes', 'Tag management', 'Sort notes by tags', 0,
+            lambda book, args: sort_notes_by_tags(book),
+            read_only=True),
+
+    Command('add-birthday', 'Birthday management', 'Add a birthday', 2,
+            lambda book, args: add_birthday_to_contact(book, args[0], args[1])),
+    Command('show-birthday', 'Birthday management', 'Show a birthday', 1,
+            lambda book, args: show_birthday(book, args[0]),
+            read_only=True),
+    Command('birthdays', 'Birthday management', 'Upcoming birthdays [days]', 0,
+            lambda book, args: upcoming_birthday(book, *args[:1]),
+            read_only=True),
+
+    Command('add-email', 'Email management', 'Add email', 2,
+            lambda book, args: add_email(book, args[0], args[1])),
+    Command('edit-email', 'Email management', 'Edit email', 2,
+            lambda book, args: edit_email(book, args[0], args[1])),
+    Command('remove-email', 'Email management', 'Remove email', 1,
+            lambda book, args: remove_email(book, args[0])),
+    Command('find-email', 'Email management', 'Find who owns an email', 1,
+            lambda book, args: who_has_email(book, args[0]),
+            read_only=True),
+    Command('domain', 'Email management', 'Contacts at an email domain', 1,
+            lambda book, args: search_by_domain(book, args[0], *args[1:3]),
+            read_only=True),
+]
+
+# Command names and aliases -> Command
+COMMANDS_BY_NAME = {name: command for command in COMMANDS
+                    for name in (command.name, *command.aliases)}
+
+
+@functools.cache
+def command_matcher():
+    """Builds the fuzzy matcher the first time input is not an exact command."""
+    return CommandMatcher(COMMANDS_BY_NAME)
+
+
+def execute(book, command, args):
+    """Runs a registered command and returns the text to print."""
+    if len(args) < command.arity:
+        if STATS is not None:
+            STATS.failed = True
+        return Fore.RED + 'Unknown command or insufficient arguments. Please try again' + Style.RESET_ALL
+    return command.handler(book, args)
+
+
+def run_script(book, lines, file=None, quiet=False):
+    """
+    Runs commands from `lines` through the same handlers as the prompt,
+    without confirmations or colours. Command names must be exact.
+    Blank lines and lines starting with '#' are skipped; 'exit' stops the script.
+    Returns (number of commands run, number of lines skipped because the
+    command is unknown or lacks arguments).
+    """
+    count = skipped = 0
+    for line in lines:
+        tokens = line.split()
+        if not tokens or tokens[0].startswith('#'):
+            continue
+        name, args = tokens[0].lower(), tokens[1:]
+        command = COMMANDS_BY_NAME.get(name)
+        if command is not None and command.handler is None:
+            break
+        if command is None:
+            skipped += 1
+            if not quiet:
+                emit(f'Unknown command: {name}', file=file, colour=False)
+            continue
+        # Timed up to the end of the output, which may be streamed
+        if STATS is not None:
+            STATS.begin(command.name)
+        output = execute(book, command, args)
+        if len(args) >= command.arity:
+            count += 1
+        else:
+            skipped += 1  # execute() reported the missing arguments
+        if not quiet:
+            emit(output, file=file, colour=False)
+        if STATS is not None:
+            STATS.end()
+    return count, skipped
+
+
+def run_batch(script, filename='addressbook.pkl', quiet=False, duplicates=('flag', 'flag')):
+    """
+    Runs a script file ('-' for stdin) against the book in `filename`.
+    Changes are grouped with book.batch(), so the book is saved once at the end.
+    Reports the throughput on stderr.
+    """
+    book = load_data(filename)
+    book.duplicate_phones, book.duplicate_emails = duplicates
+    source = sys.stdin if script == '-' else open(script, encoding='utf-8')
+    started = time.perf_counter()
+    try:
+        with source, book.batch():
+            count, skipped = run_script(book, source, quiet=quiet)
+    finally:
+        close_data(book)
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else float('inf')
+    print(f'{count} commands in {elapsed:.2f} s ({rate:.0f} commands/s)', file=sys.stderr)
+    if skipped:
+        print(f'{skipped} lines skipped: unknown command or missing arguments', file=sys.stderr)
+
+
+# ============ Network server ==================================
+
+
+class ReadWriteLock:
+    """
+    asyncio lock that lets any number of reads run together while a write
+    runs alone. A waiting write stops new reads from starting, so a steady
+    stream of reads cannot starve it.
+    """
+
+    def __init__(self):
+        # Made on first use: before Python 3.10 an asyncio.Condition binds to
+        # the event loop current when it is created, not the one serving
+        self._lazy_condition = None
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @property
+    def _condition(self):
+        if self._lazy_condition is None:
+            import asyncio
+            self._lazy_condition = asyncio.Condition()
+        return self._lazy_condition
+
+    @asynccontextmanager
+    async def reading(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writing and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def writing(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class BookServer:
+    """
+    Serves one address book to many clients over TCP or a Unix socket.
+    Each request is a command line, as typed at the prompt (exact command
+    names); each response is one JSON line: {"output": text} or {"error": text}.
+    Read-only commands run concurrently in a thread pool, commands that
+    change the book run one at a time. 'exit' closes the connection.
+    Commands that read or write files (import, export) are refused, so a
+    client cannot reach the server's file system.
+    """
+
+    def __init__(self, book, workers=8):
+        from concurrent.futures import ThreadPoolExecutor
+        self.book = book
+        self.lock = ReadWriteLock()
+        if isinstance(book, SQLiteAddressBook):
+            workers = 1  # One connection, used from one thread at a time
+        self.executor = ThreadPoolExecutor(workers)
+
+    def run(self, command, args):
+        """
+        Runs a command in a worker thread. Returns its plain-text output
+        and whether it failed.
+        """
+        if STATS is not None:
+            STATS.failed = False
+        output = render(execute(self.book, command, args))
+        return output, STATS is not None and STATS.failed
+
+    async def respond(self, line):
+        """Returns the response to one request line, or None to close the connection."""
+        import asyncio
+        tokens = line.split()
+        if not tokens:
+            return {'error': 'Empty command'}
+        command = COMMANDS_BY_NAME.get(tokens[0].lower())
+        if command is None:
+            return {'error': f'Unknown command: {tokens[0]}'}
+        if command.handler is None:
+            return None
+        if command.uses_files:
+            return {'error': f'{command.name} is not available in server mode'}
+        started = time.perf_counter()
+        lock = self.lock.reading() if command.read_only else self.lock.writing()
+        async with lock:
+            output, failed = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.run, command, tokens[1:])
+        if STATS is not None:
+            # Recorded on the event loop thread; includes the wait for the lock
+            STATS.record(command.name, time.perf_counter() - started, failed)
+        return {'output': output}
+
+    async def handle(self, reader, writer):
+        """Serves one client connection."""
+        import json
+        try:
+            while line := await reader.readline():
+                response = await self.respond(line.decode('utf-8', 'replace'))
+                if response is None:
+                    break
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address):
+        """
+        Listens on 'host:port' or on a Unix socket path until SIGTERM or
+        Ctrl+C. Without a host (':8765'), only local clients can connect.
+        """
+        import asyncio
+        import signal
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except NotImplementedError:
+            pass  # Windows: only Ctrl+C stops the server
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            # ':PORT' listens on this host only; name 0.0.0.0 to listen on all interfaces
+            server = await asyncio.start_server(self.handle, host or '127.0.0.1', int(port))
+        else:
+            server = await asyncio.start_unix_server(self.handle, address)
+        names = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        print(f'Serving {len(self.book)} contacts on {names}', file=sys.stderr)
+        async with server:
+            await stop.wait()
+
+
+def run_server(address, filename='addressbook.pkl', workers=8, autosave=(30, 1000),
+               duplicates=('flag', 'flag')):
+    """Serves the book in `filename` until interrupted, then closes it."""
+    import asyncio
+    book = load_data(filename)
+    book.duplicate_phones, book.duplicate_emails = duplicates
+    start_autosave(book, *autosave)
+    server = BookServer(book, workers)
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.executor.shutdown()
+        close_data(book)
+
+
+def main(filename='addressbook.pkl', banner=True, autosave=(30, 1000), duplicates=('flag', 'flag')):
+    init(autoreset=True)
+    book = None  # Loaded by the first command that needs it
 
     # Display a welcome message and the list of available commands
     print(Fore.BLUE + 'Hi! I am a console assistant bot' + Style.RESET_ALL)
-    print()
-    display_commands_table()
-
-    suggestion_dict = {}
-    pending_command = None
-    last_arg = []
+    if banner:
+        print()
+        display_commands_table()
+    else:
+        print("Type 'commands' to see the available commands.")
 
     # Main loop to process user commands
     while True:
@@ -923,49 +4396,24 @@ def main():
             # Handle empty input
             print(Fore.YELLOW + 'Empty input. Please try again.' + Style.RESET_ALL)
             continue
-        # === Step 1 =====
-        if pending_command:
-            args = user_input.strip().split()
-            command = pending_command
-            pending_command = None
-            print(Fore.MAGENTA + f"[DEBAG] Обрано команду: {command}")
-            print(f"[DEBAG] Аргумент (args): {args}" + Style.RESET_ALL)
-
-        # === Step 2 ======
-        elif suggestion_dict:
-            parts = user_input.strip().split()
-            if parts and parts[0].isdigit():
-                selection = int(parts[0])
-                if selection in suggestion_dict:
-                    command = suggestion_dict[selection]
-                    args = parts[1:] if len(parts) > 1 else last_arg
-                    suggestion_dict = {}
-                    pending_command = command
-                    print(Fore.MAGENTA + f'[DEBUG] Обрано команду: {pending_command}' +
-                          Style.RESET_ALL)
-                    print(Fore.CYAN +
-                          f"Введіть аргументи для команди '{pending_command}':")
-                else:
-                    print(Fore.RED + "Incorrect number" + Style.RESET_ALL)
-                    continue
-            else:
-                print(
-                    Fore.RED + "Please enter a valid selection number" + Style.RESET_ALL)
-
-        # Check for exact match with "exit" or "close"
-        if user_input.lower() in ('exit', 'close'):
-            save_data(book)  # Save the address book data before exiting
-            print('Goodbye')
-            break
 
         # Guess the command and extract arguments
-        guess_result, args, is_confident = guess_command(user_input, known_commands)
+        guess_result, args, is_confident = guess_command(user_input)
 
         if guess_result is None:
             print(Fore.RED + 'Unknown command. Please try again.' + Style.RESET_ALL)
             continue
 
-        if isinstance(guess_result, list):
+        if is_confident:
+            guessed_command = guess_result
+        elif len(guess_result) == 1:
+            # If the match is not confident, ask for confirmation
+            response = input(Fore.YELLOW + f'Maybe you meant "{guess_result[0]}"? (y/n): ' + Style.RESET_ALL)
+            if response.lower() != 'y':
+                print(Fore.RED + "Command canceled. Please try again." + Style.RESET_ALL)
+                continue
+            guessed_command = guess_result[0]
+        else:
             # If multiple suggestions are returned
             print(Fore.YELLOW + "Did you mean one of these commands?")
             for i, cmd in enumerate(guess_result, 1):
@@ -976,112 +4424,93 @@ def main():
             else:
                 print(Fore.RED + "Command selection canceled. Please try again." + Style.RESET_ALL)
                 continue
-        elif not is_confident:
-            # If the match is not confident, ask for confirmation
-            response = input(Fore.YELLOW + f'Maybe you meant "{guess_result}"? (y/n): ' + Style.RESET_ALL)
-            if response.lower() != 'y':
-                print(Fore.RED + "Command canceled. Please try again." + Style.RESET_ALL)
-                continue
-        else:
-            guessed_command = guess_result
-            
-        command = guessed_command
+
+        command = COMMANDS_BY_NAME[guessed_command]
         # Handle the "exit" and "close" commands to terminate the program
-        if command in ('exit', 'close'):
-            save_data(book)  # Save the address book data before exiting
+        if command.handler is None:
+            if book is not None:
+                close_data(book)  # Changes are journaled, just close the log
             print('Goodbye')
             break
 
-        # Process other commands
-        elif command == "hello":
-            print("Hello! How can I help you?" + Style.RESET_ALL)
-        elif command == 'add' and len(args) >= 2:
-            print(add_contact(book, args[0], args[1]))
-        elif command == 'edit-phone' and len(args) >= 3:
-            print(change_contact(book, args[0], args[1], args[2]))
-        elif command == 'edit-name' and len(args) >= 2:
-            print(edit_name(book, args[0], args[1]))
-        elif command == 'add-note' and len(args) >= 2:
-            print(add_note(book, args[0], ' '.join(args[1:])))
-        elif command == 'edit-note' and len(args) >= 2:
-            print(edit_note(book, args[0], ' '.join(args[1:])))
-        elif command == 'remove-note' and len(args) >= 1:
-            print(remove_note(book, args[0]))
-        elif command == 'show-note' and len(args) >= 1:
-            print(show_note(book, args[0]))
-        elif command == 'phone' and len(args) >= 1:
-            print(show_phone(book, args[0]))
-        elif command == 'search' and len(args) >= 1:
-            print(search_contacts(book, args[0]))
-        elif command == 'all':
-            print(show_all(book))
-        elif command == 'delete' and len(args) >= 1:
-            print(delete_contact(book, args[0]))
-        elif command == 'add-birthday' and len(args) >= 2:
-            print(add_birthday_to_contact(book, args[0], args[1]))
-        elif command == 'show-birthday' and len(args) >= 1:
-            print(show_birthday(book, args[0]))
-        elif command == 'birthdays':
-            print(upcoming_birthday(book))
-        elif command == 'remove-phone' and len(args) >= 2:
-            print(remove_phone(book, args[0], args[1]))
-        elif command == 'add-tag' and len(args) >= 2:
-            print(add_tags(book, args[0], *args[1:]))
-        elif command == 'remove-tag' and len(args) >= 2:
-            print(remove_tags(book, args[0], args[1]))
-        elif command == 'show-tags' and len(args) >= 1:
-            print(show_tags(book, args[0]))
-        elif command == 'search-tag' and len(args) >= 1:
-            print(search_by_tag(book, args[0]))
-        elif command == 'sort-notes':
-            print(sort_notes_by_tags(book))
-        elif command == 'add-email' and len(args) >= 2:
-            record = book.find_record(args[0])
-            if record:
-                try:
-                    record.set_email(args[1])
-                    print(
-                        Fore.GREEN + f"Email {args[1]} added to contact {args[0]}" + Style.RESET_ALL)
-                except ValueError as e:
-                    print(Fore.RED + f"Error: {e}" + Style.RESET_ALL)
-            else:
-                print(
-                    Fore.RED + f"Contact {args[0]} not found" + Style.RESET_ALL)
-        elif command == 'edit-email' and len(args) >= 2:
-            record = book.find_record(args[0])
-            if record:
-                try:
-                    record.edit_email(args[1])
-                    print(
-                        Fore.GREEN + f"Email {args[1]} updated for contact {args[0]}" + Style.RESET_ALL)
-                except ValueError as e:
-                    print(Fore.RED + f"Error: {e}" + Style.RESET_ALL)
-            else:
-                print(
-                    Fore.RED + f"Contact {args[0]} not found" + Style.RESET_ALL)
-        elif command == 'remove-email' and len(args) >= 1:
-            print(remove_email(book, args[0]))
-
-        elif command == 'add-address' and len(args) >= 2:
-            print(add_address(book, args[0], ' '.join(args[1:])))
-        elif command == 'edit-address' and len(args) >= 2:
-            print(edit_address(book, args[0], ' '.join(args[1:])))
-        elif command == 'remove-address' and len(args) >= 1:
-            print(remove_address(book, args[0]))
-        elif command == 'add-tag' and len(args) >= 2:
-            print(add_tag(book, args[0], args[1]))
-        elif command == 'remove-tag' and len(args[0]) >= 2:
-            print(remove_tag(book, args[0], args[1]))
-        elif command == 'show-tags' and len(args) >= 1:
-            print(show_tags(book, args[0]))
-        elif command == 'search-tag' and len(args) >= 1:
-            print(search_by_tag(book, args[0]))
-        elif command == 'all-tags':
-            print(show_all_tags(book))
+        if book is None and command.uses_book:
+            book = load_data(filename)
+            # The duplicate phone and email policies chosen on the command line
+            book.duplicate_phones, book.duplicate_emails = duplicates
+            start_autosave(book, *autosave)
+        # Timed up to the end of the output, which may be streamed
+        if STATS is not None:
+            STATS.begin(command.name)
+        emit(execute(book, command, args))
+        if STATS is not None:
+            STATS.end()
+
+
+def cli(argv=None):
+    """Parses the command line and starts the prompt or a batch run."""
+    parser = argparse.ArgumentParser(description='Console assistant bot')
+    parser.add_argument('--script', metavar='FILE',
+                        help="run commands from FILE ('-' for stdin) without prompts and exit")
+    parser.add_argument('--data', default='addressbook.pkl',
+                        help='address book file; .db/.sqlite uses SQLite, .abk a columnar snapshot')
+    parser.add_argument('--quiet', action='store_true',
+                        help='with --script, do not print command output')
+    parser.add_argument('--convert', metavar='TARGET',
+                        help='copy the --data book to TARGET (.pkl, .db or .abk) and exit')
+    parser.add_argument('--no-banner', dest='banner', action='store_false',
+                        help="start without the commands table (type 'commands' to show it)")
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help="serve the book to network clients on HOST:PORT or a Unix socket path")
+    parser.add_argument('--workers', type=int, default=8,
+                        help='with --serve, threads running read-only commands')
+    parser.add_argument('--parallel', type=int, metavar='WORKERS',
+                        help='scan books of 100000+ contacts on WORKERS processes (0: all cores)')
+    parser.add_argument('--autosave', type=float, default=30, metavar='SECONDS',
+                        help='checkpoint changes into the snapshot in the background '
+                             'this often (0: off)')
+    parser.add_argument('--autosave-changes', type=int, default=1000, metavar='N',
+                        help='also checkpoint after N changes')
+    parser.add_argument('--compress', type=parse_compression, metavar='CODEC[:LEVEL]',
+                        help="compress snapshots with none, zlib (0-9) or lzma (0-9); "
+                             "default zlib:1")
+    parser.add_argument('--duplicate-phones', choices=DUPLICATE_POLICIES, default='flag',
+                        help='adding a phone another contact has: allow it, flag it with '
+                             'a warning (default) or reject it')
+    parser.add_argument('--duplicate-emails', choices=DUPLICATE_POLICIES, default='flag',
+                        help='the same choice for an email address another contact has')
+    parser.add_argument('--stats', action='store_true',
+                        help="time every command; 'stats' shows the timings")
+    parser.add_argument('--stats-file', metavar='FILE',
+                        help='time every command and write the timings to FILE as JSON on exit')
+    options = parser.parse_args(argv)
+    global STATS, PARALLEL_SCAN, SNAPSHOT_COMPRESSION
+    if options.compress:
+        SNAPSHOT_COMPRESSION = options.compress
+    if options.stats or options.stats_file:
+        STATS = CommandStats()
+    if options.parallel is not None:
+        PARALLEL_SCAN = ParallelScan(options.parallel or None)
+    autosave = (options.autosave, options.autosave_changes)
+    duplicates = (options.duplicate_phones, options.duplicate_emails)
+    try:
+        if options.convert:
+            count = convert_data(options.data, options.convert)
+            print(f'Copied {count} contacts from {options.data} to {options.convert}')
+        elif options.script:
+            run_batch(options.script, options.data, options.quiet, duplicates)
+        elif options.serve:
+            run_server(options.serve, options.data, options.workers, autosave, duplicates)
         else:
-            print(
-                Fore.RED + 'Unknown command or insufficient arguments. Please try again' + Style.RESET_ALL)
+            main(options.data, options.banner, autosave, duplicates)
+    finally:
+        if PARALLEL_SCAN is not None:
+            PARALLEL_SCAN.close()
+        if options.stats_file:
+            STATS.dump(options.stats_file)
 
 
 if __name__ == '__main__':
-    main()
+    # Run through the importable module, so the classes in saved files are
+    # bot.Record etc. and load the same way from scripts that import bot
+    from bot import cli
+    cli()
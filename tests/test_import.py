@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import bot
+
+
+class DuplicateRowsInOneChunkTest(unittest.TestCase):
+    """Two rows with the same name in one import chunk: the last one wins."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(lambda: os.rmdir(directory))
+        self.filename = os.path.join(directory, 'contacts.csv')
+        self.addCleanup(lambda: os.remove(self.filename))
+        today = date.today()
+        with open(self.filename, 'w', newline='', encoding='utf-8') as f:
+            f.write('name,phones,birthday,email\n')
+            f.write(f'Ann,0501234567,{today:%d.%m}.1990,ann@a.com\n')
+            f.write(f'Ann,0507654321,{today + timedelta(days=1):%d.%m}.1990,ann@b.com\n')
+        self.book = bot.AddressBook()
+        self.imported, self.errors = bot.import_contacts(self.book, self.filename)
+
+    def test_indexes_hold_only_the_last_row(self):
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(self.book), 1)
+        self.assertEqual(self.book.complete('a'), ['Ann'])
+        self.assertEqual([r.name.value for r in self.book.upcoming_birthday(30)], ['Ann'])
+        self.assertEqual(self.book.search_by_domain('a.com'), [])
+        self.assertEqual([r.name.value for r in self.book.search_by_domain('b.com')], ['Ann'])
+
+    def test_delete_removes_every_entry(self):
+        self.book.delete_record('Ann')
+        self.assertEqual(self.book.complete('a'), [])
+        self.assertEqual(self.book.upcoming_birthday(30), [])
+        self.assertEqual(self.book.search_by_domain('b.com'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()